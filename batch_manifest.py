@@ -0,0 +1,88 @@
+"""
+Batch manifest for resumable detection runs
+Every input gets a line per attempt with its status, output path and
+timing, so an interrupted batch can skip finished images and retry failed
+ones a limited number of times
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+MANIFEST_FILE = "batch_manifest.jsonl"
+
+class BatchManifest:
+    """Append-only log of per-image outcomes
+
+    Each entry is written with a single os.write on a file opened with
+    O_APPEND, so entries never interleave or tear even if the process is
+    killed. The last entry for a path wins; a torn final line (from a crash
+    of the filesystem, not the process) is ignored.
+    """
+
+    def __init__(self, folder, max_attempts=3, resume=False):
+        self.path = Path(folder) / MANIFEST_FILE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+
+        # path -> (last status, failed attempts so far)
+        self.entries = {}
+        if resume and self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['path']] = (entry['status'], entry['failures'])
+        elif self.path.exists():
+            self.path.unlink()
+
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def pending(self, image_files, completed=None):
+        """Return the images that still need processing and the number given up on
+
+        completed is the set of absolute paths that are known to be done
+        (by default those whose last entry is 'done'). Images that failed
+        max_attempts times are not tried again.
+        """
+        if completed is None:
+            completed = {path for path, (status, _) in self.entries.items() if status == 'done'}
+
+        pending = []
+        given_up = 0
+        for image_path in image_files:
+            path = os.path.abspath(image_path)
+            if path in completed:
+                continue
+            status, attempts = self.entries.get(path, (None, 0))
+            if status == 'failed' and attempts >= self.max_attempts:
+                given_up += 1
+                continue
+            pending.append(image_path)
+        return pending, given_up
+
+    def finished(self, image_path, output_path, seconds, ok=True):
+        """Log the outcome of one attempt"""
+        path = os.path.abspath(image_path)
+        _, attempts = self.entries.get(path, (None, 0))
+        status = 'done' if ok else 'failed'
+        if not ok:
+            attempts += 1
+        self.entries[path] = (status, attempts)
+
+        entry = {
+            'path': path,
+            'status': status,
+            'failures': attempts,
+            'output': str(output_path) if ok and output_path else None,
+            'seconds': round(seconds, 4),
+            'time': time.time()
+        }
+        os.write(self._fd, (json.dumps(entry) + "\n").encode())
+
+    def close(self):
+        """Sync and close the manifest"""
+        os.fsync(self._fd)
+        os.close(self._fd)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the pothole detection pipeline
+Generates seeded synthetic road images, times every pipeline stage from
+decode to encode, and saves the numbers as a JSON baseline that later runs
+can be compared against
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+from detector_config import add_config_arguments, config_from_args
+from pothole_detector import PotholeDetector
+from synthetic_roads import generate_dataset
+
+STAGES = ['decode', 'resize', 'preprocess', 'canny', 'morphology', 'contours',
+          'filtering', 'drawing', 'encode']
+
+def run_stages(detector, encoded, timings=None, memory=None):
+    """Run the pipeline on one encoded image, stage by stage
+
+    timings and memory are optional dicts of lists; each stage appends its
+    wall time (seconds) or the peak memory it allocated on top of what was
+    already live (bytes).
+    """
+    def stage(name, function, *args):
+        if memory is not None:
+            tracemalloc.reset_peak()
+            live = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = function(*args)
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings[name].append(elapsed)
+        if memory is not None:
+            memory[name].append(tracemalloc.get_traced_memory()[1] - live)
+        return value
+
+    scale = detector.config.scale
+    image = stage('decode', cv2.imdecode, encoded, cv2.IMREAD_COLOR)
+    working = image
+    if scale != 1:
+        working = stage('resize', cv2.resize, image, None, None, scale, scale, cv2.INTER_AREA)
+    height, width = working.shape[:2]
+
+    processed = stage('preprocess', detector.preprocess_image, working)
+    edges = stage('canny', detector.detect_edges, processed)
+    closed = stage('morphology', detector.close_edges, edges)
+    contours, _ = stage('contours', cv2.findContours, closed, cv2.RETR_EXTERNAL,
+                        cv2.CHAIN_APPROX_SIMPLE)
+    potholes = stage('filtering', detector.filter_contours, contours, width, height, scale)
+    result = stage('drawing', detector.draw_potholes, working, potholes)
+    stage('encode', cv2.imencode, '.jpg', result)
+    return len(potholes)
+
+def summarize(samples):
+    """Latency statistics (milliseconds) and throughput for a list of timings"""
+    values = np.array(samples) * 1000
+    mean = float(values.mean())
+    return {
+        'mean_ms': mean,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'images_per_sec': 1000 / mean if mean > 0 else 0.0,
+    }
+
+def benchmark_size(detector, width, height, images, potholes, noise, seed, repeat, warmup):
+    """Benchmark one resolution and return its per-stage results"""
+    encoded = []
+    for image, _ in generate_dataset(images, width, height, potholes, noise, seed):
+        ok, buffer = cv2.imencode('.jpg', image)
+        encoded.append(buffer)
+
+    for buffer in encoded[:warmup]:
+        run_stages(detector, buffer)
+
+    timings = {name: [] for name in STAGES}
+    totals = []
+    detections = 0
+    for _ in range(repeat):
+        for buffer in encoded:
+            start = time.perf_counter()
+            detections += run_stages(detector, buffer, timings)
+            totals.append(time.perf_counter() - start)
+
+    # Peak allocations are measured in a separate pass so tracing does not skew the timings
+    memory = {name: [] for name in STAGES}
+    tracemalloc.start()
+    for buffer in encoded[:3]:
+        run_stages(detector, buffer, memory=memory)
+    tracemalloc.stop()
+
+    stages = {}
+    for name in STAGES:
+        if timings[name]:
+            stages[name] = summarize(timings[name])
+            stages[name]['peak_alloc_kb'] = max(memory[name]) / 1024
+
+    return {
+        'images': images * repeat,
+        'detections_per_image': detections / (images * repeat),
+        'stages': stages,
+        'end_to_end': summarize(totals),
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process, where the platform reports it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def compare(current, baseline, tolerance):
+    """Return (name, baseline ms, current ms) for every stage that got slower than allowed"""
+    regressions = []
+    for size, result in current['results'].items():
+        reference = baseline['results'].get(size)
+        if reference is None:
+            continue
+        pairs = [('end_to_end', reference['end_to_end'], result['end_to_end'])]
+        for name, stats in result['stages'].items():
+            if name in reference['stages']:
+                pairs.append((name, reference['stages'][name], stats))
+        for name, old, new in pairs:
+            if new['mean_ms'] > old['mean_ms'] * (1 + tolerance):
+                regressions.append((f"{size} {name}", old['mean_ms'], new['mean_ms']))
+    return regressions
+
+def parse_size(text):
+    """Parse WIDTHxHEIGHT"""
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pothole detection pipeline")
+    parser.add_argument("--sizes", nargs="+", default=["800x600", "1920x1080"],
+                        help="image resolutions as WIDTHxHEIGHT")
+    parser.add_argument("--images", type=int, default=10, help="synthetic images per resolution")
+    parser.add_argument("--potholes", type=int, default=4, help="potholes drawn per image")
+    parser.add_argument("--noise", type=int, default=20, help="asphalt texture amplitude")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the image set")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed images before measuring")
+    parser.add_argument("--save", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown against the baseline (default: 0.15 = 15%%)")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    detector = PotholeDetector(config_from_args(args))
+
+    print("POTHOLE DETECTION BENCHMARK")
+    print("=" * 70)
+
+    results = {}
+    for size in args.sizes:
+        width, height = parse_size(size)
+        result = benchmark_size(detector, width, height, args.images, args.potholes,
+                                args.noise, args.seed, args.repeat, args.warmup)
+        results[size] = result
+
+        print(f"\n{size}: {result['end_to_end']['images_per_sec']:.1f} images/sec, "
+              f"{result['detections_per_image']:.1f} detections/image")
+        print(f"  {'stage':<12}{'mean ms':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'peak KiB':>12}")
+        for name, stats in list(result['stages'].items()) + [('total', result['end_to_end'])]:
+            peak = stats.get('peak_alloc_kb')
+            peak_text = f"{peak:12.0f}" if peak is not None else ""
+            print(f"  {name:<12}{stats['mean_ms']:10.2f}{stats['p50_ms']:10.2f}"
+                  f"{stats['p90_ms']:10.2f}{stats['p99_ms']:10.2f}{peak_text}")
+
+    report = {
+        'meta': {
+            'config': detector.config.to_dict(),
+            'fingerprint': detector.fingerprint(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_threads': cv2.getNumThreads(),
+            'images': args.images,
+            'potholes': args.potholes,
+            'noise': args.noise,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'peak_rss_mb': peak_rss_mb(),
+        },
+        'results': results,
+    }
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved: {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.compare}:")
+            for name, old, new in regressions:
+                print(f"  {name}: {old:.2f} ms -> {new:.2f} ms ({new / old - 1:+.0%})")
+            return 1
+        print(f"\n✅ No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
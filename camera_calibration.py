@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Camera rig calibration for real-world pothole areas
+A profile maps the image of one camera rig onto the road plane with a
+homography, computed once from four or more pixel/ground point pairs. Pixel
+areas are converted with the Jacobian determinant of that mapping at each
+pothole's centre, for all potholes of an image at once
+"""
+import argparse
+import functools
+import json
+import os
+import cv2
+import numpy as np
+
+class CameraCalibration:
+    """Homography from image pixels to road-plane metres for one camera rig
+
+    Ground coordinates are metres in the rig's frame: X to the right of the
+    camera and Y forward along the road. The profile holds for images of the
+    resolution it was measured on (image_size); areas are in pixels of that
+    resolution. Records that carry their image size are checked against it:
+    a resized image of the same aspect ratio is scaled to the calibrated
+    resolution, and any other size (a crop or another camera) gets no ground
+    areas, counted in mismatched.
+
+    A homography scales area by |det H| / w^3, where w = h31 x + h32 y + h33
+    is the projective denominator at the point. Potholes are small against
+    the viewing distance, so that factor at the box centre converts the whole
+    contour area; points on or above the horizon (w <= 0) have no ground area.
+    A homography given directly must have w > 0 on the visible road, as
+    from_points ensures.
+    """
+
+    def __init__(self, homography, name="camera", image_size=None):
+        self.homography = np.asarray(homography, dtype=np.float64).reshape(3, 3)
+        self.name = name
+        self.image_size = tuple(image_size) if image_size else None
+        self.det = abs(np.linalg.det(self.homography))
+        # Records skipped because their image size does not fit image_size
+        self.mismatched = 0
+        self._warned = set()
+
+    @classmethod
+    def from_points(cls, image_points, ground_points, name="camera", image_size=None):
+        """Fit the homography to pixel/ground point pairs (least squares over all of them)"""
+        image_points = np.asarray(image_points, dtype=np.float64).reshape(-1, 2)
+        ground_points = np.asarray(ground_points, dtype=np.float64).reshape(-1, 2)
+        if len(image_points) < 4 or len(image_points) != len(ground_points):
+            raise ValueError("A calibration needs at least 4 matching image and ground points")
+        homography, _ = cv2.findHomography(image_points, ground_points, 0)
+        if homography is None:
+            raise ValueError("Calibration points are degenerate (e.g. three on one line)")
+        # The fit fixes H only up to sign; make w positive on the calibrated (visible) road
+        centre = image_points.mean(axis=0)
+        if homography[2] @ [centre[0], centre[1], 1.0] < 0:
+            homography = -homography
+        return cls(homography, name, image_size)
+
+    def _denominator(self, x, y):
+        h = self.homography
+        return h[2, 0] * x + h[2, 1] * y + h[2, 2]
+
+    def to_ground(self, points):
+        """Ground (X, Y) metres of an (N, 2) array of pixel positions"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        mapped = np.column_stack([points, np.ones(len(points))]) @ self.homography.T
+        return mapped[:, :2] / mapped[:, 2:]
+
+    def ground_areas(self, areas, centres):
+        """Square metres of pixel areas around (N, 2) pixel centres; NaN above the horizon"""
+        centres = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+        w = self._denominator(centres[:, 0], centres[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(w > 0, np.asarray(areas, dtype=np.float64) * self.det / w ** 3, np.nan)
+
+    def image_scale(self, width, height):
+        """(sx, sy) from pixels of a width x height image to calibrated pixels, or None
+
+        None means the image cannot be from the calibrated view: its aspect
+        ratio differs from image_size by more than 1%. Without image_size or
+        an image size the scale is 1.
+        """
+        if not self.image_size or width is None or height is None:
+            return 1.0, 1.0
+        calibrated_width, calibrated_height = self.image_size
+        scale_x = calibrated_width / width
+        scale_y = calibrated_height / height
+        if abs(scale_x - scale_y) > 0.01 * max(scale_x, scale_y):
+            return None
+        return scale_x, scale_y
+
+    def annotate(self, record):
+        """Add area_sqm and ground position to every pothole of a record (compact or full)
+
+        Returns False if the record's width and height do not fit the
+        profile (see image_scale); its potholes are then left unchanged and a
+        warning is printed once per image size.
+        """
+        scale = self.image_scale(record.get('width'), record.get('height'))
+        if scale is None:
+            self.mismatched += 1
+            size = (record['width'], record['height'])
+            if size not in self._warned:
+                self._warned.add(size)
+                print(f"Warning: {record['filename']} is {size[0]}x{size[1]}, but calibration "
+                      f"'{self.name}' is for {self.image_size[0]}x{self.image_size[1]} images; "
+                      f"no square metres for images of this size")
+            return False
+        potholes = record['potholes']
+        if not potholes:
+            return True
+        boxes = np.array([pothole['bbox'] for pothole in potholes], dtype=np.float64)
+        areas = np.array([pothole['area'] for pothole in potholes], dtype=np.float64)
+        if scale != (1.0, 1.0):
+            # Same view at another resolution: measure in calibrated pixels
+            boxes *= [scale[0], scale[1], scale[0], scale[1]]
+            areas *= scale[0] * scale[1]
+        centres = boxes[:, :2] + boxes[:, 2:] / 2
+        ground_areas = self.ground_areas(areas, centres)
+        ground = self.to_ground(centres)
+        for pothole, area_sqm, (x, y) in zip(potholes, ground_areas.tolist(), ground.tolist()):
+            if area_sqm == area_sqm:  # not NaN
+                pothole['area_sqm'] = round(area_sqm, 4)
+                pothole['ground'] = [round(x, 3), round(y, 3)]
+        return True
+
+    def to_dict(self):
+        """Return the profile as a JSON-ready dict"""
+        profile = {'name': self.name, 'homography': self.homography.tolist()}
+        if self.image_size:
+            profile['image_size'] = list(self.image_size)
+        return profile
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a calibration from a profile dict with a homography or point pairs"""
+        if 'homography' in data:
+            return cls(data['homography'], data.get('name', "camera"), data.get('image_size'))
+        return cls.from_points(data['image_points'], data['ground_points'],
+                               data.get('name', "camera"), data.get('image_size'))
+
+@functools.lru_cache(maxsize=None)
+def _load_profile(path, modified):
+    with open(path) as f:
+        return CameraCalibration.from_dict(json.load(f))
+
+def load_calibration(profile_path):
+    """Load a calibration profile (JSON); each rig's homography is fitted once per process
+
+    A profile has a name, optionally the image_size it applies to, and
+    either a 3x3 homography or image_points and ground_points.
+    """
+    path = os.path.abspath(profile_path)
+    return _load_profile(path, os.path.getmtime(path))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show what a camera calibration profile does")
+    parser.add_argument("profile", help="calibration profile (JSON)")
+    parser.add_argument("--area", type=float, default=1000.0,
+                        help="pixel area to convert across the image (default: 1000)")
+    args = parser.parse_args(argv)
+
+    calibration = load_calibration(args.profile)
+    print(f"CAMERA CALIBRATION: {calibration.name}")
+    print("=" * 40)
+    print("Homography (pixels -> metres):")
+    for row in calibration.homography:
+        print("  " + "  ".join(f"{value:12.6g}" for value in row))
+
+    if calibration.image_size:
+        width, height = calibration.image_size
+        print(f"\n{args.area:.0f} pixels in square metres across the {width}x{height} image:")
+        xs = np.linspace(0, width, 5)
+        for y in np.linspace(height, 0, 5):
+            areas = calibration.ground_areas(np.full(len(xs), args.area),
+                                             np.column_stack([xs, np.full(len(xs), y)]))
+            cells = "  ".join("   horizon" if np.isnan(area) else f"{area:10.4f}"
+                              for area in areas)
+            print(f"  y={y:6.0f}: {cells}")
+
+if __name__ == "__main__":
+    main()
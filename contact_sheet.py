@@ -0,0 +1,143 @@
+"""
+Paged contact-sheet renderer for the detection summary
+Thumbnails are built directly with OpenCV and written one page at a time,
+so the cost grows linearly with the number of images and memory stays bounded
+"""
+import cv2
+import numpy as np
+from pathlib import Path
+
+# JPEG and friends can be decoded at 1/2, 1/4 or 1/8 scale much faster than at full size
+_REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+    (1, cv2.IMREAD_COLOR),
+]
+
+def decode_reduced(path, max_width, max_height, first_factor=8):
+    """Decode an image at the smallest reduced scale that still covers the thumbnail size
+
+    Returns (image, factor). Decoding starts at first_factor and falls back to
+    larger scales when the result is too small, so passing the factor that
+    worked for the previous image of a batch usually needs a single decode.
+    """
+    image = None
+    for factor, flag in _REDUCED_FLAGS:
+        if factor > first_factor:
+            continue
+        image = cv2.imread(str(path), flag)
+        if image is None:
+            return None, factor
+        height, width = image.shape[:2]
+        if factor == 1 or (width >= max_width and height >= max_height):
+            return image, factor
+    return image, 1
+
+def _fit(image, max_width, max_height):
+    """Shrink an image to fit the thumbnail box, keeping its aspect ratio"""
+    height, width = image.shape[:2]
+    scale = min(max_width / width, max_height / height, 1.0)
+    if scale == 1.0:
+        return image
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+class ContactSheetWriter:
+    """Lay out before/after thumbnail pairs on fixed-size pages
+
+    Each image gets one cell with the original on top and the detection result
+    below it. A page is written to disk as soon as it is full and its buffer is
+    reused for the next page.
+    """
+
+    def __init__(self, output_folder, total_images, name="detection_summary",
+                 thumb_width=240, thumb_height=180, columns=6, rows=4):
+        self.output_folder = Path(output_folder)
+        self.name = name
+        self.thumb_width = thumb_width
+        self.thumb_height = thumb_height
+        self.columns = columns
+        self.rows = rows
+
+        self.caption_height = 24
+        self.padding = 10
+        self.cell_width = thumb_width + self.padding
+        self.cell_height = 2 * (thumb_height + self.caption_height) + self.padding
+
+        self.per_page = columns * rows
+        self.total_pages = max(1, -(-total_images // self.per_page))
+        self.page_paths = []
+
+        # Pages never grow past columns x rows cells; a short batch gets a smaller page
+        used_columns = min(columns, max(1, total_images))
+        used_rows = min(rows, max(1, -(-total_images // columns)))
+        self.page = np.full((used_rows * self.cell_height + self.padding,
+                             used_columns * self.cell_width + self.padding, 3),
+                            255, dtype=np.uint8)
+        self.slot = 0
+        # Reduced decode scale that worked last; images in a batch tend to share a size
+        self.decode_factor = 8
+
+    def add(self, original, result, original_title, result_title):
+        """Add one image pair; original and result may be arrays or paths"""
+        row, column = divmod(self.slot, self.columns)
+        x = self.padding + column * self.cell_width
+        y = self.padding + row * self.cell_height
+
+        for source, title in ((original, original_title), (result, result_title)):
+            self._caption(title, x, y + self.caption_height - 8)
+            y += self.caption_height
+
+            thumb = self._thumbnail(source)
+            if thumb is not None:
+                h, w = thumb.shape[:2]
+                self.page[y:y + h, x:x + w] = thumb
+            y += self.thumb_height
+
+        self.slot += 1
+        if self.slot == self.per_page:
+            self._flush()
+
+    def close(self):
+        """Write the last partially filled page and return the paths of all pages"""
+        if self.slot:
+            self._flush()
+        return self.page_paths
+
+    def _thumbnail(self, source):
+        """Build one thumbnail, starting from the last reduced decode scale that fit"""
+        if isinstance(source, np.ndarray):
+            return _fit(source, self.thumb_width, self.thumb_height)
+
+        image, factor = decode_reduced(source, self.thumb_width, self.thumb_height,
+                                       self.decode_factor)
+        if image is None:
+            return None
+        # Next image: try this scale first, or the next smaller one if this had room to spare
+        self.decode_factor = factor
+        height, width = image.shape[:2]
+        if factor < 8 and width >= 2 * self.thumb_width and height >= 2 * self.thumb_height:
+            self.decode_factor = factor * 2
+        return _fit(image, self.thumb_width, self.thumb_height)
+
+    def _caption(self, text, x, y):
+        """Draw a caption, trimmed so it stays inside its cell"""
+        max_chars = self.thumb_width // 8
+        if len(text) > max_chars:
+            text = text[:max_chars - 3] + "..."
+        cv2.putText(self.page, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.4, (0, 0, 0), 1, cv2.LINE_AA)
+
+    def _flush(self):
+        """Write the current page and clear it for reuse"""
+        if self.total_pages == 1:
+            path = self.output_folder / f"{self.name}.png"
+        else:
+            path = self.output_folder / f"{self.name}_{len(self.page_paths) + 1:03d}.png"
+
+        cv2.imwrite(str(path), self.page)
+        self.page_paths.append(path)
+
+        self.page[:] = 255
+        self.slot = 0
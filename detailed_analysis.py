@@ -2,126 +2,127 @@
 """
 Demonstration script showing step-by-step pothole detection
 on an image similar to the uploaded one
+The steps are those of PotholeDetector itself, captured with
+capture_intermediates=True, so the analysis always matches production
 """
+import argparse
+import collections
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 from pathlib import Path
 
-def demonstrate_detection():
-    """Show step-by-step detection process"""
-    
-    image_path = "input_images/uploaded_pothole_road.jpg"
-    
+from camera_calibration import load_calibration
+from detector_config import add_config_arguments, config_from_args
+from pothole_detector import PotholeDetector
+
+DEFAULT_IMAGE = "input_images/uploaded_pothole_road.jpg"
+
+# Rejection reasons as shown in the analysis
+REASON_LABELS = {
+    'too_small': "below minimum area",
+    'too_large': "above maximum area",
+    'zero_perimeter': "zero perimeter",
+    'circularity': "circularity out of range",
+    'aspect_ratio': "aspect ratio out of range",
+    'too_narrow': "narrower than minimum size",
+}
+
+def stage_strip(steps, height=360):
+    """Enhanced, edges and closed stages side by side, scaled to one height"""
+    tiles = []
+    for name in ('enhanced', 'edges', 'closed'):
+        stage = steps[name]
+        width = max(1, round(stage.shape[1] * height / stage.shape[0]))
+        tile = cv2.cvtColor(cv2.resize(stage, (width, height), interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_GRAY2BGR)
+        cv2.putText(tile, name, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 255), 2)
+        tiles.append(tile)
+    return np.hstack(tiles)
+
+def demonstrate_detection(config=None, image_path=DEFAULT_IMAGE, output_folder="output_results",
+                          calibration=None):
+    """Show step-by-step detection process (areas in square metres with a CameraCalibration)"""
     if not Path(image_path).exists():
         print("Image not found. Please run save_uploaded_image.py first.")
         return
-    
+
     print("🔍 STEP-BY-STEP POTHOLE DETECTION ANALYSIS")
     print("=" * 60)
-    
+
+    detector = PotholeDetector(config, capture_intermediates=True)
+
     # Load image
-    image = cv2.imread(image_path)
+    image = detector.read_image(image_path)
     print(f"📸 Loaded image: {Path(image_path).name}")
     print(f"   Dimensions: {image.shape[1]}x{image.shape[0]} pixels")
-    
+
+    potholes = detector.find_potholes(image)
+    steps = detector.intermediates
+
     # Step 1: Preprocessing
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(blurred)
-    
-    print("\\n🔧 PREPROCESSING COMPLETE:")
+    print("\n🔧 PREPROCESSING COMPLETE:")
     print("   ✅ Converted to grayscale")
     print("   ✅ Applied Gaussian blur (noise reduction)")
     print("   ✅ Enhanced contrast with CLAHE")
-    
-    # Step 2: Edge detection
-    edges = cv2.Canny(enhanced, 50, 150)
-    
-    # Step 3: Morphological operations
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
-    
-    print("\\n🎯 EDGE DETECTION:")
+
+    # Steps 2 and 3: Edge detection and morphological operations
+    print("\n🎯 EDGE DETECTION:")
     print("   ✅ Canny edge detection applied")
     print("   ✅ Morphological closing to connect edges")
-    
-    # Step 4: Find and filter contours
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    height, width = image.shape[:2]
-    potholes = []
-    min_area = 200
-    max_area = width * height * 0.3
-    
-    print(f"\\n📊 CONTOUR ANALYSIS:")
-    print(f"   🔍 Found {len(contours)} total contours")
-    print(f"   📏 Size filter: {min_area} - {max_area} pixels")
-    
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        
-        if min_area < area < max_area:
-            perimeter = cv2.arcLength(contour, True)
-            if perimeter > 0:
-                circularity = 4 * np.pi * area / (perimeter * perimeter)
-                x, y, w, h = cv2.boundingRect(contour)
-                aspect_ratio = float(w) / h
-                
-                if (0.1 < circularity < 1.2 and 
-                    0.3 < aspect_ratio < 3.0 and
-                    w > 20 and h > 20):
-                    
-                    potholes.append({
-                        'contour': contour,
-                        'area': area,
-                        'bbox': (x, y, w, h),
-                        'circularity': circularity,
-                        'aspect_ratio': aspect_ratio
-                    })
-    
+
+    # Step 4: Contours and why they were dropped
+    min_area, max_area = steps['area_range']
+    rejected = collections.Counter(reason for reason in steps['rejections'] if reason)
+
+    print(f"\n📊 CONTOUR ANALYSIS:")
+    print(f"   🔍 Found {len(steps['contours'])} total contours")
+    print(f"   📏 Size filter: {min_area:.0f} - {max_area:.0f} pixels")
+    for reason, count in rejected.most_common():
+        print(f"   ❌ {count} rejected: {REASON_LABELS[reason]}")
     print(f"   ✅ After filtering: {len(potholes)} potholes detected")
-    
+
     # Step 5: Draw results
-    result_image = image.copy()
-    
-    print("\\n🎨 MARKING DETECTED POTHOLES:")
+    result_image = detector.draw_potholes(image, potholes)
+    if calibration is not None:
+        calibration.annotate({'potholes': potholes})
+
+    print("\n🎨 MARKING DETECTED POTHOLES:")
     for i, pothole in enumerate(potholes):
-        # Draw contour in green
-        cv2.drawContours(result_image, [pothole['contour']], -1, (0, 255, 0), 3)
-        
-        # Draw bounding box in blue
         x, y, w, h = pothole['bbox']
-        cv2.rectangle(result_image, (x, y), (x + w, y + h), (255, 0, 0), 3)
-        
-        # Add label in yellow
-        label = f"Pothole {i+1}"
-        cv2.putText(result_image, label, (x, y-10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
-        
-        # Print details
-        area_sqm = pothole['area'] / 10000
         print(f"   🕳️  Pothole {i+1}:")
-        print(f"      📐 Area: {pothole['area']:.0f} pixels (~{area_sqm:.2f} sq.m)")
+        if 'area_sqm' in pothole:
+            print(f"      📐 Area: {pothole['area']:.0f} pixels ({pothole['area_sqm']:.3f} sq.m)")
+        else:
+            area_sqm = pothole['area'] / 10000
+            print(f"      📐 Area: {pothole['area']:.0f} pixels (~{area_sqm:.2f} sq.m)")
         print(f"      🔵 Circularity: {pothole['circularity']:.2f}")
-        print(f"      📊 Aspect Ratio: {pothole['aspect_ratio']:.2f}")
+        print(f"      📊 Aspect Ratio: {w / h:.2f}")
         print(f"      📍 Location: ({x}, {y})")
-    
-    # Add summary
-    summary_text = f"Potholes detected: {len(potholes)}"
-    cv2.putText(result_image, summary_text, (10, 40), 
-               cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3)
-    
-    # Save detailed result
-    output_path = "output_results/detailed_analysis.jpg"
-    cv2.imwrite(output_path, result_image)
-    
-    print(f"\\n✅ DETECTION COMPLETE!")
+
+    # Save detailed result and the intermediate stages
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    output_path = Path(output_folder) / "detailed_analysis.jpg"
+    stages_path = Path(output_folder) / "detailed_stages.jpg"
+    cv2.imwrite(str(output_path), result_image)
+    cv2.imwrite(str(stages_path), stage_strip(steps))
+
+    print(f"\n✅ DETECTION COMPLETE!")
     print(f"📁 Detailed result saved: {output_path}")
+    print(f"📁 Intermediate stages saved: {stages_path}")
     print(f"🎯 Total potholes found: {len(potholes)}")
-    
+
     return len(potholes), result_image
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Step-by-step pothole detection analysis")
+    parser.add_argument("image", nargs="?", default=DEFAULT_IMAGE, help="image to analyse")
+    parser.add_argument("--output", default="output_results", help="folder for results")
+    parser.add_argument("--calibration", default=None, metavar="PROFILE",
+                        help="camera rig calibration profile (JSON) for areas in square metres")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+    calibration = load_calibration(args.calibration) if args.calibration else None
+    demonstrate_detection(config_from_args(args), args.image, args.output, calibration)
+
 if __name__ == "__main__":
-    demonstrate_detection()
+    main()
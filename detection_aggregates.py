@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Running aggregates and checkpoints for detection batches
+Totals, an area histogram, the distribution of potholes per image and the
+largest potholes are updated as each image finishes, and checkpointed
+together with a journal of per-image records, so reports never need a pass
+over all results and a crashed batch can pick up where it stopped
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+from detection_cache import write_json_atomic
+
+# Pothole area histogram bin edges in pixels (log-spaced, last bin open-ended)
+AREA_BINS = [int(edge) for edge in np.geomspace(100, 1_000_000, 17)]
+
+# Real-world area bin edges in square metres for calibrated potholes (last bin open-ended)
+GROUND_AREA_BINS = [0.0, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0]
+
+# Images with this many potholes or more share the last per-image count bin
+MAX_COUNT_BIN = 20
+
+CHECKPOINT_FILE = "detection_checkpoint.json"
+JOURNAL_FILE = "detection_journal.jsonl"
+
+class DetectionAggregates:
+    """Batch statistics that are updated one record at a time
+
+    Memory and update cost do not depend on the number of images: only
+    totals, two histograms and the top_k largest potholes are kept.
+    """
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.images = 0
+        self.potholes = 0
+        self.area_sum = 0.0
+        self.area_histogram = [0] * len(AREA_BINS)
+        self.count_histogram = [0] * (MAX_COUNT_BIN + 1)
+        # Potholes with a calibrated area_sqm (see camera_calibration.py)
+        self.ground_potholes = 0
+        self.ground_area_sum = 0.0
+        self.ground_histogram = [0] * len(GROUND_AREA_BINS)
+        # Min-heap of (area, filename, bbox)
+        self.largest = []
+
+    def update(self, record):
+        """Add one detection record (compact or full)"""
+        self.images += 1
+        self.potholes += record['pothole_count']
+        self.count_histogram[min(record['pothole_count'], MAX_COUNT_BIN)] += 1
+
+        for pothole in record['potholes']:
+            area = float(pothole['area'])
+            self.area_sum += area
+            index = int(np.searchsorted(AREA_BINS, area, side='right')) - 1
+            self.area_histogram[max(index, 0)] += 1
+
+            area_sqm = pothole.get('area_sqm')
+            if area_sqm is not None:
+                self.ground_potholes += 1
+                self.ground_area_sum += area_sqm
+                index = int(np.searchsorted(GROUND_AREA_BINS, area_sqm, side='right')) - 1
+                self.ground_histogram[max(index, 0)] += 1
+
+            entry = (area, record['filename'], [int(v) for v in pothole['bbox']])
+            if len(self.largest) < self.top_k:
+                heapq.heappush(self.largest, entry)
+            elif entry > self.largest[0]:
+                heapq.heapreplace(self.largest, entry)
+
+    def mean_area(self):
+        """Mean pothole area in pixels"""
+        return self.area_sum / self.potholes if self.potholes else 0.0
+
+    def top(self):
+        """Largest potholes as (area, filename, bbox), largest first"""
+        return sorted(self.largest, reverse=True)
+
+    def to_dict(self):
+        """Return the aggregates as a JSON-ready dict"""
+        return {
+            'top_k': self.top_k,
+            'images': self.images,
+            'potholes': self.potholes,
+            'area_sum': self.area_sum,
+            'area_bins': AREA_BINS,
+            'area_histogram': self.area_histogram,
+            'count_histogram': self.count_histogram,
+            'ground_potholes': self.ground_potholes,
+            'ground_area_sum': self.ground_area_sum,
+            'ground_histogram': self.ground_histogram,
+            'largest': [list(entry) for entry in self.largest]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore aggregates saved with to_dict"""
+        aggregates = cls(data['top_k'])
+        aggregates.images = data['images']
+        aggregates.potholes = data['potholes']
+        aggregates.area_sum = data['area_sum']
+        aggregates.area_histogram = list(data['area_histogram'])
+        aggregates.count_histogram = list(data['count_histogram'])
+        # Checkpoints from before calibration support have no ground areas
+        aggregates.ground_potholes = data.get('ground_potholes', 0)
+        aggregates.ground_area_sum = data.get('ground_area_sum', 0.0)
+        aggregates.ground_histogram = list(data.get('ground_histogram',
+                                                    [0] * len(GROUND_AREA_BINS)))
+        aggregates.largest = [tuple(entry) for entry in data['largest']]
+        heapq.heapify(aggregates.largest)
+        return aggregates
+
+    def write_summary(self, f):
+        """Write the aggregate sections of the text report"""
+        f.write(f"Total images processed: {self.images}\n")
+        f.write(f"Total potholes detected: {self.potholes}\n")
+        if self.potholes:
+            f.write(f"Mean pothole area: {self.mean_area():.0f} pixels\n")
+        if self.ground_potholes:
+            f.write(f"Calibrated potholes: {self.ground_potholes}, "
+                    f"total {self.ground_area_sum:.2f} sq.m, "
+                    f"mean {self.ground_area_sum / self.ground_potholes:.3f} sq.m\n")
+
+        f.write("\nAREA DISTRIBUTION (pixels):\n")
+        f.write("-" * 30 + "\n")
+        for i, count in enumerate(self.area_histogram):
+            if count:
+                upper = f"{AREA_BINS[i + 1]}" if i + 1 < len(AREA_BINS) else "+"
+                f.write(f"  {AREA_BINS[i]:>8} - {upper:<8} {count}\n")
+
+        if self.ground_potholes:
+            f.write("\nAREA DISTRIBUTION (sq.m, calibrated):\n")
+            f.write("-" * 30 + "\n")
+            for i, count in enumerate(self.ground_histogram):
+                if count:
+                    upper = f"{GROUND_AREA_BINS[i + 1]:g}" if i + 1 < len(GROUND_AREA_BINS) else "+"
+                    f.write(f"  {GROUND_AREA_BINS[i]:>8g} - {upper:<8} {count}\n")
+
+        f.write("\nPOTHOLES PER IMAGE:\n")
+        f.write("-" * 30 + "\n")
+        for count, images in enumerate(self.count_histogram):
+            if images:
+                label = f"{count}+" if count == MAX_COUNT_BIN else f"{count}"
+                f.write(f"  {label:>3}: {images} image(s)\n")
+
+        f.write("\nLARGEST POTHOLES:\n")
+        f.write("-" * 30 + "\n")
+        for area, filename, (x, y, w, h) in self.top():
+            f.write(f"  {area:.0f} pixels in {filename} at ({x}, {y}, {w}x{h})\n")
+
+class BatchCheckpoint:
+    """Journal of finished images plus periodic aggregate checkpoints
+
+    Every finished image is appended to the journal right away. Every
+    flush_every images or flush_seconds seconds the journal is synced and
+    the aggregates are written atomically together with the journal length
+    they cover. When resuming, journal lines past that point are replayed and
+    a torn last line is cut off, so nothing that reached the journal is lost.
+    Without resume an earlier journal and checkpoint are discarded. The
+    journal is read one line at a time and only the paths of its images are
+    kept (see completed); iter_records reads the records again when needed.
+
+    With a DetectionStore (records must be journaled before they are added to
+    it) the checkpoint remembers how many images the store held when the
+    batch started. Journal record i is then store image store_base + i, and
+    on resume the records whose rows were still buffered when the process
+    died are added to the store again.
+    """
+
+    def __init__(self, folder, flush_every=50, flush_seconds=30, top_k=10, resume=True,
+                 store=None):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_path = self.folder / CHECKPOINT_FILE
+        self.journal_path = self.folder / JOURNAL_FILE
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        if not resume:
+            for path in (self.checkpoint_path, self.journal_path):
+                if path.exists():
+                    path.unlink()
+
+        self.aggregates = DetectionAggregates(top_k)
+        # Absolute paths of the images found in the journal when it was opened
+        self.done = set()
+        self.journaled = 0
+        offset = 0
+        store_base = None
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self.aggregates = DetectionAggregates.from_dict(checkpoint['aggregates'])
+            offset = checkpoint['journal_bytes']
+            store_base = checkpoint.get('store_base')
+
+        # Journal records from this index on are missing from the store
+        restore_from = None
+        if store is not None and store_base is not None:
+            restore_from = max(0, store.image_count - store_base)
+        lost = []
+        valid_bytes = self._read_journal(offset, restore_from, lost)
+        if self.journal_path.exists():
+            # Drop a line that was cut off by a crash
+            os.truncate(self.journal_path, valid_bytes)
+        self._journal = open(self.journal_path, 'a')
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+        self.store = store
+        # Journaled images added to the store again on resume
+        self.restored = 0
+        if store is not None:
+            if store_base is None and not self.journaled:
+                store_base = store.image_count
+            # A journal from before the store was tracked has nothing to match it with
+            self.store_base = store_base
+            for record in lost:
+                store.add(record)
+                self.restored += 1
+            # The store base must be on disk before the first image is journaled
+            self.save()
+
+    def _lines(self):
+        """(start offset, line) of each complete journal line"""
+        with open(self.journal_path, 'rb') as f:
+            position = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                yield position, line
+                position += len(line)
+
+    def _read_journal(self, checkpoint_bytes, restore_from, lost):
+        """Scan the journal, replaying the records the checkpoint does not cover
+
+        Records from index restore_from on are collected in lost. Returns the
+        length of the journal up to its last complete line.
+        """
+        if not self.journal_path.exists():
+            if checkpoint_bytes:
+                # Checkpoint without its journal: start over
+                self.aggregates = DetectionAggregates(self.aggregates.top_k)
+            return 0
+
+        if checkpoint_bytes > self.journal_path.stat().st_size:
+            # The journal is shorter than the checkpoint says; rebuild from the journal
+            self.aggregates = DetectionAggregates(self.aggregates.top_k)
+            checkpoint_bytes = 0
+
+        valid_bytes = 0
+        for position, line in self._lines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self.done.add(os.path.abspath(record['path']))
+            if position >= checkpoint_bytes:
+                self.aggregates.update(record)
+            if restore_from is not None and self.journaled >= restore_from:
+                lost.append(record)
+            self.journaled += 1
+            valid_bytes = position + len(line)
+        return valid_bytes
+
+    def completed(self):
+        """Absolute paths of the images already in the journal"""
+        return self.done
+
+    def iter_records(self):
+        """Read back the records that were in the journal when it was opened, in order"""
+        for count, (_, line) in enumerate(self._lines()):
+            if count >= self.journaled:
+                break
+            yield json.loads(line)
+
+    def add(self, record):
+        """Journal a finished image and update the aggregates"""
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        self.aggregates.update(record)
+        self._unsaved += 1
+        if (self._unsaved >= self.flush_every or
+                time.monotonic() - self._saved_at >= self.flush_seconds):
+            self.save()
+
+    def save(self):
+        """Sync the journal and checkpoint the aggregates"""
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        checkpoint = {
+            'journal_bytes': self._journal.tell(),
+            'aggregates': self.aggregates.to_dict()
+        }
+        if self.store is not None:
+            checkpoint['store_base'] = self.store_base
+        write_json_atomic(self.checkpoint_path, checkpoint)
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    def close(self):
+        """Write a final checkpoint and close the journal"""
+        self.save()
+        self._journal.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print batch totals from a detection checkpoint")
+    parser.add_argument("folder", help="output folder of a run with --checkpoint")
+    args = parser.parse_args(argv)
+
+    with open(Path(args.folder) / CHECKPOINT_FILE) as f:
+        aggregates = DetectionAggregates.from_dict(json.load(f)['aggregates'])
+    aggregates.write_summary(sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+On-disk cache of detection results
+Entries are keyed by the image content hash plus a fingerprint of the
+detector parameters, so unchanged images are never decoded again and any
+change to the thresholds invalidates the cache automatically
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+def hash_file(path, block_size=1 << 20):
+    """Return the BLAKE2b hex digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_json_atomic(path, data):
+    """Write JSON through a temporary file so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+class DetectionCache:
+    """Content-addressed cache of compact detection records
+
+    A stat index (path -> size, mtime, content hash) lets unchanged files skip
+    hashing as well, so a re-run over a large folder only stats each file.
+    An output index (annotated image path -> size, mtime, entry key) records
+    which entry each annotated image was rendered from, so a hit is only
+    served while its annotated image has not been replaced by another run.
+    The cache is trimmed to max_bytes on close(), least recently used first.
+    """
+
+    def __init__(self, cache_dir, fingerprint, max_bytes=1 << 30):
+        self.cache_dir = Path(cache_dir)
+        self.entries_dir = self.cache_dir / "entries"
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.index_path = self.cache_dir / "index.json"
+        # A damaged index only costs re-hashing
+        self.index = self._load_index(self.index_path)
+        self._index_dirty = False
+        # A damaged output index only costs re-rendering
+        self.outputs_path = self.cache_dir / "outputs.json"
+        self.outputs = self._load_index(self.outputs_path)
+        self._outputs_dirty = False
+
+    @staticmethod
+    def _load_index(path):
+        """Read a JSON index, or start an empty one if it is missing or damaged"""
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def content_hash(self, image_path):
+        """Return the content hash of a file, reusing the stat index when the file is unchanged"""
+        path = os.path.abspath(image_path)
+        stat = os.stat(path)
+        entry = self.index.get(path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        digest = hash_file(path)
+        self.index[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._index_dirty = True
+        return digest
+
+    def _entry_key(self, image_path):
+        """Key of the cache entry for an image under the current fingerprint"""
+        return hashlib.blake2b(f"{self.content_hash(image_path)}:{self.fingerprint}".encode(),
+                               digest_size=20).hexdigest()
+
+    def _entry_path(self, key):
+        """Path of the cache entry with a given key"""
+        return self.entries_dir / key[:2] / f"{key}.json"
+
+    def _output_stamp(self, output_path):
+        """(absolute path, [size, mtime]) of an annotated image, or (path, None) if it is missing"""
+        path = os.path.abspath(output_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path, None
+        return path, [stat.st_size, stat.st_mtime_ns]
+
+    def lookup(self, image_path, output_path=None):
+        """Return the cached record for an image, or None on a miss
+
+        With output_path, it is also a miss unless the annotated image there
+        is still the one rendered from this entry.
+        """
+        key = self._entry_key(image_path)
+        if output_path is not None:
+            path, stamp = self._output_stamp(output_path)
+            if stamp is None or self.outputs.get(path) != [*stamp, key]:
+                self.misses += 1
+                return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Mark as recently used for eviction
+        os.utime(entry_path)
+        self.hits += 1
+
+        # The same content may have been cached under another name
+        record['path'] = str(image_path)
+        record['filename'] = os.path.basename(image_path)
+        for pothole in record['potholes']:
+            pothole['bbox'] = tuple(pothole['bbox'])
+        return record
+
+    def store(self, image_path, record, output_path=None):
+        """Cache the compact record of an image, and note the annotated image rendered from it"""
+        key = self._entry_key(image_path)
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        write_json_atomic(entry_path, record)
+
+        if output_path is not None:
+            path, stamp = self._output_stamp(output_path)
+            if stamp is not None:
+                self.outputs[path] = [*stamp, key]
+                self._outputs_dirty = True
+
+    def close(self):
+        """Save the indexes and evict the least recently used entries over max_bytes"""
+        if self._index_dirty:
+            write_json_atomic(self.index_path, self.index)
+            self._index_dirty = False
+        if self._outputs_dirty:
+            write_json_atomic(self.outputs_path, self.outputs)
+            self._outputs_dirty = False
+        self.evict()
+
+    def evict(self):
+        """Delete the oldest entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.entries_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        # Trim a little below the limit so the next run does not evict again right away
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
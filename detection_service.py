@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Resident pothole detection service
+Keeps warm PotholeDetector worker processes and answers HTTP requests on a
+local port: POST an encoded image to /detect and get its detections back as
+JSON. Requests that arrive close together are sent to the workers as one
+micro-batch. A request that gets no answer in time, or whose worker died,
+is answered with 503 and a dead worker pool is replaced
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import queue
+import signal
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import cv2
+import numpy as np
+
+from detector_config import add_config_arguments, config_from_args
+from pothole_detector import PotholeDetector
+
+# Per-process detector of the service workers
+_service_detector = None
+
+# Seconds a request waits for its detections before it is answered with 503
+REQUEST_TIMEOUT = 30.0
+
+def _init_service_worker(config, threads=1):
+    """Build the detector once per worker process and warm it up"""
+    global _service_detector
+    # Ctrl+C is handled by the parent, which then shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Spare cores go to OpenCV's own threads, which shortens each request
+    cv2.setNumThreads(threads)
+    _service_detector = PotholeDetector(config, render=False, keep_contours=False)
+    # The first call pays for lazy OpenCV initialisation; do it before any request
+    _service_detector.find_potholes(np.zeros((64, 64, 3), dtype=np.uint8))
+
+def _detect_batch(items):
+    """Worker task: decode and detect a list of (name, encoded image) pairs
+
+    Returns one (record, error) pair per item; record is the compact
+    detection record plus the worker time in detect_ms.
+    """
+    results = []
+    for name, data in items:
+        started = time.perf_counter()
+        try:
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                results.append((None, "could not decode image"))
+                continue
+            record, _ = _service_detector.annotate(image, name)
+        except Exception as error:
+            results.append((None, str(error)))
+            continue
+        record['detect_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        results.append((record, None))
+    return results
+
+def _shutdown_pool(pool, wait=True):
+    """Shut a worker pool down, dropping its queued batches where Python can (3.9+)"""
+    if sys.version_info >= (3, 9):
+        pool.shutdown(wait=wait, cancel_futures=True)
+    else:
+        pool.shutdown(wait=wait)
+
+class DetectionService:
+    """Warm worker pool with dynamic micro-batching
+
+    submit() queues an image and returns a Future. A dispatcher thread hands
+    work to the pool whenever a worker is free: it takes the oldest waiting
+    image, then whatever else arrives within max_wait_ms, up to max_batch
+    images, as one task. At light load a request goes out almost at once; under
+    load the queue fills while the workers are busy and batches grow, so the
+    per-task overhead is shared.
+
+    If a worker process dies, the executor fails every batch in flight with
+    BrokenProcessPool, which frees their workers, and the next batch starts a
+    new pool. Requests that time out while still queued are dropped.
+    """
+
+    def __init__(self, config=None, workers=1, max_batch=8, max_wait_ms=2.0):
+        self.workers = max(1, workers)
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.config = config
+        self.pool = self._start_pool()
+        self.requests = 0
+        self.batches = 0
+        self.restarts = 0
+        self._queue = queue.Queue()
+        self._free = threading.Semaphore(self.workers)
+        self._stop = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def _start_pool(self):
+        """Start the worker processes and wait until all of them are warm"""
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        pool = ProcessPoolExecutor(self.workers, initializer=_init_service_worker,
+                                   initargs=(self.config, threads))
+        # Workers start on demand; one task each starts them all before the first request
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        return pool
+
+    def submit(self, data, name="image"):
+        """Queue one encoded image; the Future resolves to (record, error)
+
+        The Future raises BrokenProcessPool instead if its worker died.
+        """
+        future = Future()
+        self._queue.put((name, data, future))
+        return future
+
+    def detect(self, data, name="image", timeout=REQUEST_TIMEOUT):
+        """Detect potholes in one encoded image and wait for the (record, error) pair
+
+        Raises concurrent.futures.TimeoutError (the built-in TimeoutError
+        from Python 3.11) after timeout seconds (the request is dropped if
+        it has not reached a worker yet) and BrokenProcessPool if its worker
+        died.
+        """
+        future = self.submit(data, name)
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def _dispatch(self):
+        """Dispatcher thread: form batches and send them to free workers"""
+        while not self._stop.is_set():
+            if not self._free.acquire(timeout=0.1):
+                continue
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                self._free.release()
+                continue
+
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+
+            # Requests that timed out while queued were cancelled by detect()
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                self._free.release()
+                continue
+
+            self.requests += len(batch)
+            self.batches += 1
+            futures = [future for _, _, future in batch]
+            items = [(name, data) for name, data, _ in batch]
+            try:
+                task = self.pool.submit(_detect_batch, items)
+            except BrokenProcessPool:
+                # A worker died since the last batch; replace the whole pool
+                _shutdown_pool(self.pool, wait=False)
+                self.pool = self._start_pool()
+                self.restarts += 1
+                print(f"⚠️  A worker process died; restarted the pool ({self.restarts})")
+                task = self.pool.submit(_detect_batch, items)
+            task.add_done_callback(lambda task, futures=futures: self._done(futures, task))
+
+    def _done(self, futures, task):
+        self._free.release()
+        error = task.exception()
+        if error is None:
+            for future, result in zip(futures, task.result()):
+                future.set_result(result)
+        elif isinstance(error, BrokenProcessPool):
+            for future in futures:
+                future.set_exception(error)
+        else:
+            for future in futures:
+                future.set_result((None, str(error)))
+
+    def stats(self):
+        """Request and batch counters"""
+        return {
+            'workers': self.workers,
+            'requests': self.requests,
+            'batches': self.batches,
+            'restarts': self.restarts,
+            'mean_batch': round(self.requests / self.batches, 2) if self.batches else 0.0
+        }
+
+    def close(self):
+        """Stop dispatching and shut the workers down"""
+        self._stop.set()
+        self._dispatcher.join(timeout=1)
+        _shutdown_pool(self.pool)
+
+class _Handler(BaseHTTPRequestHandler):
+    """POST /detect?name=<filename> with the image as body; GET /health"""
+
+    # Keep-alive, so a client does not pay for a new connection per image, and
+    # no Nagle delay between the header and body writes of a reply
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._reply(404, {'error': "not found"})
+            return
+        self._reply(200, dict(status="ok", **self.server.service.stats()))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/detect":
+            self._reply(404, {'error': "not found"})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        if not length:
+            self._reply(400, {'error': "empty request body"})
+            return
+        data = self.rfile.read(length)
+        name = parse_qs(url.query).get('name', ["image"])[0]
+
+        try:
+            record, error = self.server.service.detect(data, name, self.server.request_timeout)
+        except futures.TimeoutError:
+            self._reply(503, {'error': "detection timed out"})
+            return
+        except BrokenProcessPool:
+            self._reply(503, {'error': "worker process died"})
+            return
+        if error is not None:
+            self._reply(400, {'error': error})
+            return
+        self._reply(200, record)
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def start_server(service, host="127.0.0.1", port=8765, verbose=False,
+                 request_timeout=REQUEST_TIMEOUT):
+    """Serve a DetectionService over HTTP on a background thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    server.request_timeout = request_timeout
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def benchmark(image_path, host, port, requests=200, concurrency=4):
+    """Send one image repeatedly over keep-alive connections and return latencies in ms"""
+    data = Path(image_path).read_bytes()
+    name = os.path.basename(image_path)
+
+    def client(count):
+        connection = http.client.HTTPConnection(host, port)
+        connection.connect()
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            connection.request("POST", f"/detect?name={name}", body=data)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise IOError(f"service answered {response.status}")
+            latencies.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        return latencies
+
+    per_client = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(client, per_client))
+    return [latency for latencies in results for latency in latencies]
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local pothole detection service")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (0: any free port)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="detector processes (default: one per CPU)")
+    parser.add_argument("--max-batch", type=int, default=8,
+                        help="most images sent to a worker as one task")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0,
+                        help="how long a batch waits for more images before it is sent")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT,
+                        help=f"seconds before a request is answered with 503 "
+                             f"(default: {REQUEST_TIMEOUT:g})")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--benchmark", metavar="IMAGE", default=None,
+                        help="measure latency with this image against the service and exit")
+    parser.add_argument("--requests", type=int, default=200, help="requests sent by --benchmark")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="parallel clients used by --benchmark")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    print("POTHOLE DETECTION SERVICE")
+    print("=" * 40)
+
+    service = DetectionService(config_from_args(args), workers=args.workers or os.cpu_count(),
+                               max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    server = start_server(service, args.host, 0 if args.benchmark else args.port, args.verbose,
+                          args.timeout)
+    host, port = server.server_address[:2]
+
+    try:
+        if args.benchmark:
+            # Warm-up requests are not counted
+            benchmark(args.benchmark, host, port, requests=service.workers * 2,
+                      concurrency=service.workers)
+            latencies = benchmark(args.benchmark, host, port, args.requests, args.concurrency)
+            print(f"Requests: {len(latencies)} with {args.concurrency} client(s)")
+            print(f"Latency p50: {percentile(latencies, 0.5):.1f} ms, "
+                  f"p99: {percentile(latencies, 0.99):.1f} ms, "
+                  f"mean: {statistics.mean(latencies):.1f} ms")
+            print(f"Mean batch size: {service.stats()['mean_batch']}")
+            return
+
+        print(f"✅ Listening on http://{host}:{port} with {service.workers} worker(s)")
+        print(f"   curl --data-binary @road.jpg 'http://{host}:{port}/detect?name=road.jpg'")
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Columnar store of per-pothole detections
+Every pothole becomes one row of a NumPy structured array, written in .npy
+shards that can be memory-mapped, so analytics over millions of detections
+read the columns directly instead of parsing reports or re-running detection
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+import cv2
+import numpy as np
+
+# One row per pothole; contour_offset/contour_length index the shard's contour points
+DETECTION_DTYPE = np.dtype([
+    ('image_id', np.int64),
+    ('x', np.int32),
+    ('y', np.int32),
+    ('width', np.int32),
+    ('height', np.int32),
+    ('area', np.float64),
+    ('circularity', np.float64),
+    ('aspect_ratio', np.float32),
+    ('contour_offset', np.int64),
+    ('contour_length', np.int32),
+])
+
+def _shard_index(path):
+    """Shard number from a name like detections_00012.npy"""
+    return int(path.stem.rsplit('_', 1)[1])
+
+def _save_npy_atomic(path, array):
+    """Save an array through a temporary file so readers never see a partial shard"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+class DetectionStore:
+    """Appendable store of detections in .npy shards
+
+    A shard is three files: detections_NNNNN.npy (the rows),
+    contours_NNNNN.npy (simplified contour points as an (N, 2) int32 array,
+    only with contours=True) and images_NNNNN.jsonl (one line per image with
+    its id, path and pothole count). The images file is written last, so a
+    shard only counts once it exists; a crash mid-flush loses the unflushed
+    images and nothing else. Image ids keep counting across runs, from the
+    per-shard image counts in shards.json, so opening a store does not read
+    its images files.
+    """
+
+    def __init__(self, folder, contours=False, epsilon=1.0, shard_rows=65536):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.contours = contours
+        self.epsilon = epsilon
+        self.shard_rows = shard_rows
+
+        self._shard_counts = self.shard_image_counts()
+        existing = [_shard_index(path) for path in self.folder.glob('detections_*.npy')]
+        self._next_shard = max([*self._shard_counts, *existing], default=-1) + 1
+        self._next_id = sum(self._shard_counts.values())
+
+        self._rows = []
+        self._points = []
+        self._point_count = 0
+        self._images = []
+
+    def add(self, record):
+        """Add the potholes of one detection record (compact or full) and return its image id"""
+        image_id = self._next_id
+        self._next_id += 1
+        self._images.append({
+            'id': image_id,
+            'path': str(record['path']),
+            'filename': record['filename'],
+            'pothole_count': record['pothole_count']
+        })
+
+        for pothole in record['potholes']:
+            x, y, w, h = pothole['bbox']
+            offset, length = 0, 0
+            contour = pothole.get('contour')
+            if self.contours and contour is not None:
+                contour = np.asarray(contour, dtype=np.int32).reshape(-1, 1, 2)
+                points = cv2.approxPolyDP(contour, self.epsilon, True).reshape(-1, 2)
+                offset, length = self._point_count, len(points)
+                self._points.append(points)
+                self._point_count += length
+            self._rows.append((image_id, x, y, w, h, pothole['area'], pothole['circularity'],
+                               w / h if h else 0.0, offset, length))
+
+        if len(self._rows) >= self.shard_rows or len(self._images) >= self.shard_rows:
+            self.flush()
+        return image_id
+
+    @property
+    def image_count(self):
+        """Number of images in the store, including buffered ones and those of earlier runs"""
+        return self._next_id
+
+    def flush(self):
+        """Write the buffered rows as a new shard"""
+        if not self._images:
+            return
+        index = self._next_shard
+        self._next_shard += 1
+
+        _save_npy_atomic(self.folder / f"detections_{index:05d}.npy",
+                         np.array(self._rows, dtype=DETECTION_DTYPE))
+        if self.contours:
+            points = (np.concatenate(self._points) if self._points
+                      else np.empty((0, 2), dtype=np.int32))
+            _save_npy_atomic(self.folder / f"contours_{index:05d}.npy", points.astype(np.int32))
+
+        # Written last: marks the shard as complete
+        images_path = self.folder / f"images_{index:05d}.jsonl"
+        with open(f"{images_path}.tmp", 'w') as f:
+            for image in self._images:
+                f.write(json.dumps(image) + "\n")
+        os.replace(f"{images_path}.tmp", images_path)
+        self._shard_counts[index] = len(self._images)
+        self._save_shard_counts(self._shard_counts)
+
+        self._rows = []
+        self._points = []
+        self._point_count = 0
+        self._images = []
+
+    def close(self):
+        """Flush whatever is still buffered"""
+        self.flush()
+
+    def shard_indices(self):
+        """Numbers of the complete shards, in order"""
+        return sorted(_shard_index(path) for path in self.folder.glob('images_*.jsonl'))
+
+    def shard_image_counts(self):
+        """{shard number: image count} of the complete shards
+
+        Counts come from shards.json. A shard missing there (from before the
+        index existed, or a flush that crashed before updating it) is counted
+        from its images file once and added to the index.
+        """
+        try:
+            with open(self.folder / "shards.json") as f:
+                listed = {int(index): count for index, count in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            # A missing or damaged index only costs counting the lines again
+            listed = {}
+
+        counts = {}
+        stale = False
+        for index in self.shard_indices():
+            if index not in listed:
+                with open(self.folder / f"images_{index:05d}.jsonl") as f:
+                    listed[index] = sum(1 for _ in f)
+                stale = True
+            counts[index] = listed[index]
+        if stale:
+            self._save_shard_counts(counts)
+        return counts
+
+    def _save_shard_counts(self, counts):
+        """Write shards.json through a temporary file"""
+        counts_path = self.folder / "shards.json"
+        with open(f"{counts_path}.tmp", 'w') as f:
+            json.dump({f"{index:05d}": count for index, count in sorted(counts.items())}, f)
+        os.replace(f"{counts_path}.tmp", counts_path)
+
+    def read_images(self, index):
+        """Image entries of one shard"""
+        with open(self.folder / f"images_{index:05d}.jsonl") as f:
+            return [json.loads(line) for line in f]
+
+    def iter_shards(self, mmap=True):
+        """Yield (rows, points) per shard; points is None without stored contours
+
+        With mmap=True the arrays are memory-mapped, so only the columns and
+        rows that are actually touched are read from disk.
+        """
+        mode = 'r' if mmap else None
+        for index in self.shard_indices():
+            rows = np.load(self.folder / f"detections_{index:05d}.npy", mmap_mode=mode)
+            contours_path = self.folder / f"contours_{index:05d}.npy"
+            points = np.load(contours_path, mmap_mode=mode) if contours_path.exists() else None
+            yield rows, points
+
+    def rows(self):
+        """All rows of all shards as one in-memory array"""
+        shards = [rows for rows, _ in self.iter_shards()]
+        if not shards:
+            return np.empty(0, dtype=DETECTION_DTYPE)
+        return np.concatenate(shards)
+
+    def images(self):
+        """All image entries, in id order"""
+        images = []
+        for index in self.shard_indices():
+            images.extend(self.read_images(index))
+        return images
+
+def contour_points(row, points):
+    """Simplified contour of one row as an (N, 1, 2) int32 array for cv2 drawing"""
+    start = int(row['contour_offset'])
+    return np.asarray(points[start:start + int(row['contour_length'])]).reshape(-1, 1, 2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a detection store")
+    parser.add_argument("folder", help="store folder written with --store")
+    args = parser.parse_args(argv)
+
+    store = DetectionStore(args.folder)
+    potholes = 0
+    area_sum = 0.0
+    largest = 0.0
+    images = store.image_count
+    for rows, _ in store.iter_shards():
+        area = rows['area']
+        potholes += len(area)
+        if len(area):
+            area_sum += float(area.sum())
+            largest = max(largest, float(area.max()))
+
+    print(f"Shards: {len(store.shard_indices())}")
+    print(f"Images: {images}")
+    print(f"Potholes: {potholes}")
+    if potholes:
+        print(f"Mean area: {area_sum / potholes:.0f} pixels")
+        print(f"Largest area: {largest:.0f} pixels")
+
+if __name__ == "__main__":
+    main()
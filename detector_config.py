@@ -0,0 +1,117 @@
+"""
+Detector settings for the pothole detection pipeline
+One immutable, hashable DetectorConfig replaces the thresholds that used
+to be literals in the pipeline; it can be loaded from a JSON file and
+overridden from the command line
+"""
+import argparse
+import hashlib
+import json
+from dataclasses import dataclass, asdict, fields, replace
+
+# Bump when the pipeline changes in a way that alters results for the same settings
+PIPELINE_VERSION = 1
+
+@dataclass(frozen=True)
+class DetectorConfig:
+    """Settings for preprocessing, edge detection and contour filtering
+
+    Size thresholds are in pixels of the input image. With scale < 1 the
+    pipeline runs on a downscaled copy and the thresholds are scaled to
+    match, so a profile means the same thing at any processing resolution.
+    """
+    # Preprocessing
+    scale: float = 1.0
+    blur_kernel: int = 5
+    clahe_clip_limit: float = 2.0
+    clahe_grid: int = 8
+
+    # Edge detection and gap closing
+    canny_low: int = 50
+    canny_high: int = 150
+    morph_kernel: int = 5
+
+    # Contour filtering
+    min_area: float = 200.0
+    max_area_fraction: float = 0.3
+    min_circularity: float = 0.1
+    max_circularity: float = 1.2
+    min_aspect_ratio: float = 0.3
+    max_aspect_ratio: float = 3.0
+    min_size: int = 20
+
+    def __post_init__(self):
+        # Equal settings must serialise (and fingerprint) alike, e.g. 200 and 200.0
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if type(value) is field.type:
+                continue
+            try:
+                coerced = field.type(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{field.name} must be {field.type.__name__}, got {value!r}")
+            if coerced != value:
+                raise ValueError(f"{field.name} must be {field.type.__name__}, got {value!r}")
+            object.__setattr__(self, field.name, coerced)
+        if not 0 < self.scale <= 1:
+            raise ValueError(f"scale must be in (0, 1], got {self.scale}")
+        if self.blur_kernel % 2 == 0:
+            raise ValueError(f"blur_kernel must be odd, got {self.blur_kernel}")
+
+    def to_dict(self):
+        """Return the settings as a plain dict"""
+        return asdict(self)
+
+    def fingerprint(self):
+        """Return a stable hash of the settings and the pipeline version"""
+        data = json.dumps({'pipeline': PIPELINE_VERSION, **self.to_dict()}, sort_keys=True)
+        return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+    def with_overrides(self, **overrides):
+        """Return a copy with some settings changed"""
+        return replace(self, **overrides)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a config from a dict, rejecting unknown keys"""
+        known = {field.name for field in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown detector settings: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a config from a JSON file"""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        """Write the config to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+def add_config_arguments(parser):
+    """Add --config and one override option per setting to an argparse parser"""
+    group = parser.add_argument_group("detector settings")
+    group.add_argument("--config", default=None, help="JSON file with detector settings")
+    for field in fields(DetectorConfig):
+        group.add_argument(f"--{field.name.replace('_', '-')}", dest=field.name,
+                           type=field.type,
+                           default=None, help=f"(default: {field.default})")
+
+def config_from_args(args):
+    """Build the config from --config plus any per-setting overrides"""
+    config = DetectorConfig.from_file(args.config) if args.config else DetectorConfig()
+    overrides = {
+        field.name: getattr(args, field.name)
+        for field in fields(DetectorConfig)
+        if getattr(args, field.name, None) is not None
+    }
+    return config.with_overrides(**overrides) if overrides else config
+
+if __name__ == "__main__":
+    # Print the effective settings, e.g. to start a profile file
+    parser = argparse.ArgumentParser(description="Show detector settings as JSON")
+    add_config_arguments(parser)
+    print(json.dumps(config_from_args(parser.parse_args()).to_dict(), indent=2))
@@ -0,0 +1,96 @@
+"""
+Instrumentation hooks for the pothole detection pipeline
+A PotholeDetector with hooks attached reports the wall time of every stage
+and counters such as contours found and bytes read; MetricsCollector
+aggregates them into a machine-readable metrics file
+"""
+import json
+import time
+
+class DetectorHooks:
+    """Base class for instrumentation callbacks; override the events you need"""
+
+    def on_stage(self, name, seconds):
+        """Called after a pipeline stage with its wall time"""
+
+    def on_count(self, name, value):
+        """Called with a counter increment, e.g. contours found or bytes written"""
+
+class EventRecorder(DetectorHooks):
+    """Hooks that only record events, so they can be replayed elsewhere
+
+    Used in batch worker processes: the events of each image travel back with
+    its record and are replayed on the hooks of the parent detector.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def on_stage(self, name, seconds):
+        self.events.append(('stage', name, seconds))
+
+    def on_count(self, name, value):
+        self.events.append(('count', name, value))
+
+    def drain(self):
+        """Return the recorded events and start a new list"""
+        events, self.events = self.events, []
+        return events
+
+def replay(events, hooks):
+    """Send recorded events to another set of hooks"""
+    for kind, name, value in events:
+        if kind == 'stage':
+            hooks.on_stage(name, value)
+        else:
+            hooks.on_count(name, value)
+
+class MetricsCollector(DetectorHooks):
+    """Aggregates stage timings and counters for a whole run
+
+    Stage times from worker processes are added up, so with several workers
+    the stage totals can exceed the wall time of the run.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # name -> [calls, total, min, max] in seconds
+        self.stages = {}
+        self.counters = {}
+
+    def on_stage(self, name, seconds):
+        stats = self.stages.get(name)
+        if stats is None:
+            self.stages[name] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+
+    def on_count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        """Return the metrics as a plain dict"""
+        stage_total = sum(stats[1] for stats in self.stages.values())
+        stages = {}
+        for name, (calls, total, low, high) in self.stages.items():
+            stages[name] = {
+                'calls': calls,
+                'total_seconds': total,
+                'mean_ms': total / calls * 1000,
+                'min_ms': low * 1000,
+                'max_ms': high * 1000,
+                'share': total / stage_total if stage_total else 0.0
+            }
+        return {
+            'wall_seconds': time.perf_counter() - self.started,
+            'stages': stages,
+            'counters': dict(self.counters)
+        }
+
+    def save(self, path):
+        """Write the metrics to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
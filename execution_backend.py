@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Execution backends for the detection pipeline
+A backend is a number of detector processes, the OpenCV threads each of
+them may use, and whether the stages run on cv2.UMat. choose_backend times
+the candidates that fit the host's cores on sample images and picks the
+fastest, so many workers are not left fighting over the same cores
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass
+import cv2
+import numpy as np
+
+from detector_config import add_config_arguments, config_from_args
+from synthetic_roads import generate_dataset
+
+@dataclass(frozen=True)
+class ExecutionBackend:
+    """How the pipeline uses the host's cores
+
+    workers is the number of detector processes and threads the OpenCV
+    threads per process (0 keeps OpenCV's default, one per core). With
+    umat=True the stages run on cv2.UMat; OpenCL is used when OpenCV finds a
+    device, otherwise the T-API runs the same CPU code.
+    """
+    workers: int = 1
+    threads: int = 0
+    umat: bool = False
+
+    def apply(self):
+        """Configure OpenCV threading and OpenCL in the current process"""
+        if self.threads:
+            cv2.setNumThreads(self.threads)
+        cv2.ocl.setUseOpenCL(self.umat and cv2.ocl.haveOpenCL())
+
+    def __str__(self):
+        threads = self.threads or "default"
+        umat = ", UMat" if self.umat else ""
+        return f"{self.workers} process(es) x {threads} OpenCV thread(s){umat}"
+
+def candidate_backends(cores=None):
+    """Backends worth timing on a host: intra-op threads, processes and a mix, each with and without UMat"""
+    cores = cores or os.cpu_count() or 1
+    layouts = [(1, cores), (cores, 1)]
+    if cores >= 4:
+        layouts.append((cores // 2, 2))
+
+    candidates = []
+    for umat in (False, True):
+        for workers, threads in layouts:
+            backend = ExecutionBackend(workers, threads, umat)
+            if backend not in candidates:
+                candidates.append(backend)
+    return candidates
+
+# Per-process detector used while timing a backend
+_backend_detector = None
+
+def _init_backend_worker(backend, config):
+    """Apply the backend and build a detector once per worker process"""
+    global _backend_detector
+    # Imported here because pothole_detector itself imports this module
+    from pothole_detector import PotholeDetector
+    backend.apply()
+    _backend_detector = PotholeDetector(config, render=False, keep_contours=False,
+                                        use_umat=backend.umat)
+
+def _detect_encoded(encoded):
+    """Worker task: decode one image and return its pothole count"""
+    image = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    return len(_backend_detector.find_potholes(image))
+
+def time_backend(backend, encoded, config=None, repeat=1):
+    """Images per second for decode + detection of encoded images with one backend
+
+    Every backend runs in fresh processes, so the threading settings of one
+    candidate never leak into the next.
+    """
+    with multiprocessing.Pool(backend.workers, initializer=_init_backend_worker,
+                              initargs=(backend, config)) as pool:
+        # Warm up every worker (first-call initialisation, buffer allocation)
+        pool.map(_detect_encoded, encoded[:backend.workers] * 2, chunksize=1)
+        start = time.perf_counter()
+        pool.map(_detect_encoded, encoded * repeat, chunksize=1)
+        elapsed = time.perf_counter() - start
+    return len(encoded) * repeat / elapsed if elapsed > 0 else 0.0
+
+def choose_backend(encoded, config=None, cores=None, repeat=1):
+    """Time every candidate backend and return (fastest, [(backend, images per second), ...])"""
+    timings = [(backend, time_backend(backend, encoded, config, repeat))
+               for backend in candidate_backends(cores)]
+    best = max(timings, key=lambda timing: timing[1])[0]
+    return best, timings
+
+def encode_images(image_paths, limit=8):
+    """Read up to limit image files as encoded bytes for choose_backend"""
+    encoded = []
+    for image_path in itertools.islice(image_paths, limit):
+        with open(image_path, 'rb') as f:
+            encoded.append(np.frombuffer(f.read(), dtype=np.uint8))
+    return encoded
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time execution backends on synthetic roads")
+    parser.add_argument("--size", default="1920x1080", help="image size as WIDTHxHEIGHT")
+    parser.add_argument("--images", type=int, default=8, help="synthetic images per run")
+    parser.add_argument("--repeat", type=int, default=2, help="passes over the image set")
+    parser.add_argument("--cores", type=int, default=None,
+                        help="cores to plan for (default: all of this host)")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    width, height = (int(value) for value in args.size.lower().split('x'))
+    encoded = [cv2.imencode('.jpg', image)[1]
+               for image, _ in generate_dataset(args.images, width, height)]
+
+    print("EXECUTION BACKENDS")
+    print("=" * 40)
+    print(f"Cores: {args.cores or os.cpu_count()}, OpenCL available: {cv2.ocl.haveOpenCL()}")
+    best, timings = choose_backend(encoded, config_from_args(args), args.cores, args.repeat)
+    for backend, images_per_sec in timings:
+        marker = "✅" if backend == best else "  "
+        print(f"{marker} {str(backend):<45} {images_per_sec:6.1f} images/sec")
+
+if __name__ == "__main__":
+    main()
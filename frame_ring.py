@@ -0,0 +1,80 @@
+"""
+Shared-memory ring of frame slots
+Producers decode frames straight into a slot of one shared memory block and
+worker processes run the pipeline on a NumPy view of that slot, so a frame
+crosses the process boundary as a slot index instead of a pickled array
+"""
+import queue
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+def prepare_workers():
+    """Call before starting worker processes that will attach to rings
+
+    Attaching registers the shared memory with the resource tracker. Workers
+    started before the parent's tracker runs get trackers of their own, which
+    unlink the memory when the worker exits, under the owner's feet; workers
+    started afterwards share the parent's tracker instead.
+    """
+    resource_tracker.ensure_running()
+
+class FrameRing:
+    """Fixed number of equally sized uint8 frame slots in shared memory
+
+    The process that creates the ring owns it: it hands out free slots with
+    acquire() and gives them back with release() once the frame's results are
+    in, so a slot is never overwritten while a worker still reads it. Workers
+    only call FrameRing.attach(*ring.spec) and view().
+
+    Worker processes must be started after prepare_workers() (see there).
+    """
+
+    def __init__(self, slots, shape, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.slot_bytes = int(np.prod(self.shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+            self._free = queue.Queue()
+            for slot in range(slots):
+                self._free.put(slot)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self._free = None
+
+    @classmethod
+    def attach(cls, slots, shape, name):
+        """Open an existing ring by name (in a worker process)"""
+        return cls(slots, shape, name)
+
+    @property
+    def spec(self):
+        """Picklable (slots, shape, name) to attach to this ring elsewhere"""
+        return self.slots, self.shape, self.shm.name
+
+    def fits(self, shape):
+        """True if a frame of this shape can be stored in a slot"""
+        return tuple(shape) == self.shape
+
+    def view(self, slot):
+        """The frame in a slot as a NumPy array backed by the shared memory"""
+        return np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+
+    def acquire(self, timeout=None):
+        """Take a free slot, waiting up to timeout seconds; None if none came free"""
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        """Give a slot back once nothing reads its frame any more"""
+        self._free.put(slot)
+
+    def close(self):
+        """Detach from the shared memory; the owner also frees it"""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Geo-tagged deduplication of detections across a survey
+Each image gets a location from a CSV table, a JSON sidecar or its EXIF GPS
+tags; its potholes go into a grid index in local metres where detections
+within a merge radius of an existing pothole (from another image) count as
+the same pothole
+"""
+import argparse
+import csv
+import json
+import math
+import struct
+import time
+from array import array
+from pathlib import Path
+import numpy as np
+
+# Metres per degree of latitude (mean); longitude is scaled by cos(latitude)
+METERS_PER_DEGREE = 111_320.0
+
+def _exif_rational(data, offset, order):
+    """One unsigned RATIONAL as a float"""
+    numerator, denominator = struct.unpack_from(order + "II", data, offset)
+    return numerator / denominator if denominator else 0.0
+
+def _exif_ifd(data, offset, order):
+    """Entries of one IFD as {tag: (type, count, value field offset)}"""
+    count, = struct.unpack_from(order + "H", data, offset)
+    entries = {}
+    for i in range(count):
+        tag, kind, values = struct.unpack_from(order + "HHI", data, offset + 2 + i * 12)
+        entries[tag] = (kind, values, offset + 2 + i * 12 + 8)
+    return entries
+
+def read_exif_gps(image_path):
+    """(lat, lon) from the EXIF GPS tags of a JPEG, or None
+
+    Only the APP1 segment is parsed (no imaging library needed); anything
+    unexpected in the file just means there is no location.
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            data = f.read(1 << 16)
+        if data[:2] != b"\xff\xd8":
+            return None
+
+        position = 2
+        while position + 4 <= len(data) and data[position] == 0xFF:
+            marker = data[position + 1]
+            length, = struct.unpack_from(">H", data, position + 2)
+            if marker == 0xE1 and data[position + 4:position + 10] == b"Exif\x00\x00":
+                return _parse_exif_gps(data[position + 10:position + 2 + length])
+            if marker == 0xDA:
+                break
+            position += 2 + length
+    except (OSError, struct.error, ValueError):
+        pass
+    return None
+
+def _parse_exif_gps(tiff):
+    """GPS position from a TIFF/EXIF block"""
+    order = "<" if tiff[:2] == b"II" else ">"
+    ifd0 = _exif_ifd(tiff, struct.unpack_from(order + "I", tiff, 4)[0], order)
+    if 0x8825 not in ifd0:
+        return None
+    gps = _exif_ifd(tiff, struct.unpack_from(order + "I", tiff, ifd0[0x8825][2])[0], order)
+
+    def coordinate(ref_tag, value_tag, negative):
+        if ref_tag not in gps or value_tag not in gps:
+            return None
+        reference = tiff[gps[ref_tag][2]:gps[ref_tag][2] + 1]
+        offset, = struct.unpack_from(order + "I", tiff, gps[value_tag][2])
+        degrees, minutes, seconds = (_exif_rational(tiff, offset + 8 * i, order) for i in range(3))
+        value = degrees + minutes / 60 + seconds / 3600
+        return -value if reference == negative else value
+
+    lat = coordinate(1, 2, b"S")
+    lon = coordinate(3, 4, b"W")
+    if lat is None or lon is None:
+        return None
+    return lat, lon
+
+def load_location_table(csv_path):
+    """{filename: location} from a CSV with filename, lat, lon and optional heading columns
+
+    A filename is a bare file name or a path relative to the input folder
+    (as records name images found with --recursive), with / separators.
+    """
+    table = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            location = {'lat': float(row['lat']), 'lon': float(row['lon'])}
+            if row.get('heading'):
+                location['heading'] = float(row['heading'])
+            table[row['filename'].replace('\\', '/')] = location
+    return table
+
+class GeoLocator:
+    """Find where an image was taken
+
+    Looks in the optional table (see load_location_table) first, by the
+    image's record name and then by its file name, then in a
+    sidecar JSON next to the image (road.jpg -> road.json, with lat, lon and
+    optionally heading), then in the EXIF GPS tags. Returns None if none of
+    them has a location.
+    """
+
+    def __init__(self, table=None):
+        self.table = table or {}
+
+    def locate(self, image_path, name=None):
+        path = Path(image_path)
+        # Same-named images in different subfolders are told apart by their record name
+        for key in (name, path.name):
+            location = self.table.get(key) if key else None
+            if location is not None:
+                return location
+
+        sidecar = path.with_suffix('.json')
+        if sidecar.exists():
+            try:
+                with open(sidecar) as f:
+                    data = json.load(f)
+                location = {'lat': float(data['lat']), 'lon': float(data['lon'])}
+                if data.get('heading') is not None:
+                    location['heading'] = float(data['heading'])
+                return location
+            except (OSError, ValueError, KeyError, TypeError):
+                print(f"Warning: Ignoring unreadable location sidecar {sidecar}")
+
+        position = read_exif_gps(path)
+        if position is not None:
+            return {'lat': position[0], 'lon': position[1]}
+        return None
+
+class GeoIndex:
+    """Unique potholes in a uniform grid over local metric coordinates
+
+    Latitude/longitude are projected to metres around the first location
+    (equirectangular, accurate to well under a metre over a city-sized
+    survey). The grid cell equals the merge radius, so finding merge
+    candidates touches at most 3x3 cells whatever the number of potholes.
+    A detection joins the nearest pothole within radius metres that has no
+    detection from the same image yet (potholes seen together in one image
+    are distinct); otherwise it starts a new pothole. Positions are the
+    running mean of the merged detections. Coordinates and counters live in
+    flat arrays, so millions of potholes stay compact.
+    """
+
+    def __init__(self, radius=3.0, locator=None):
+        self.radius = radius
+        self.locator = locator or GeoLocator()
+        self.origin = None
+        self.x = array('d')
+        self.y = array('d')
+        self.hits = array('l')
+        self.max_area = array('d')
+        self.last_image = array('l')
+        self.first_filename = []
+        self._grid = {}
+        self.images = 0
+        self.unlocated = 0
+        self.detections = 0
+
+    def project(self, lat, lon):
+        """Local (x, y) metres of a latitude/longitude"""
+        if self.origin is None:
+            self.origin = (lat, lon, math.cos(math.radians(lat)))
+        lat0, lon0, cos_lat0 = self.origin
+        return (lon - lon0) * METERS_PER_DEGREE * cos_lat0, (lat - lat0) * METERS_PER_DEGREE
+
+    def unproject(self, x, y):
+        """Latitude/longitude of local metres"""
+        lat0, lon0, cos_lat0 = self.origin
+        return lat0 + y / METERS_PER_DEGREE, lon0 + x / (METERS_PER_DEGREE * cos_lat0)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.radius), math.floor(y / self.radius)
+
+    def add_record(self, record):
+        """Locate a detection record (stores it in record['location']) and index its potholes
+
+        Potholes with a calibrated ground position (see camera_calibration)
+        are placed at that offset from the camera when the location has a
+        heading (degrees clockwise from north); otherwise at the camera.
+        Returns the unique pothole id of every pothole, or None if the image
+        has no location.
+        """
+        location = record.get('location')
+        if location is None:
+            location = self.locator.locate(record['path'], record.get('filename'))
+            if location is None:
+                self.unlocated += 1
+                return None
+            record['location'] = location
+
+        image_id = self.images
+        self.images += 1
+        x, y = self.project(location['lat'], location['lon'])
+        heading = location.get('heading')
+        if heading is not None:
+            sin_h, cos_h = math.sin(math.radians(heading)), math.cos(math.radians(heading))
+
+        ids = []
+        for pothole in record['potholes']:
+            px, py = x, y
+            ground = pothole.get('ground')
+            if ground is not None and heading is not None:
+                # Rig frame (right, forward) to east/north
+                right, forward = ground
+                px += right * cos_h + forward * sin_h
+                py += forward * cos_h - right * sin_h
+            ids.append(self.add(px, py, image_id, pothole['area'], record['filename']))
+        return ids
+
+    def add(self, x, y, image_id, area, filename):
+        """Index one detection at local metres (x, y) and return its unique pothole id"""
+        self.detections += 1
+        best = None
+        best_distance = self.radius * self.radius
+        cx, cy = self._cell(x, y)
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for i in self._grid.get((gx, gy), ()):
+                    if self.last_image[i] == image_id:
+                        continue
+                    distance = (self.x[i] - x) ** 2 + (self.y[i] - y) ** 2
+                    if distance <= best_distance:
+                        best, best_distance = i, distance
+
+        if best is None:
+            best = len(self.x)
+            self.x.append(x)
+            self.y.append(y)
+            self.hits.append(1)
+            self.max_area.append(area)
+            self.last_image.append(image_id)
+            self.first_filename.append(filename)
+            self._grid.setdefault((cx, cy), []).append(best)
+            return best
+
+        old_cell = self._cell(self.x[best], self.y[best])
+        hits = self.hits[best] + 1
+        self.x[best] += (x - self.x[best]) / hits
+        self.y[best] += (y - self.y[best]) / hits
+        self.hits[best] = hits
+        self.max_area[best] = max(self.max_area[best], area)
+        self.last_image[best] = image_id
+        new_cell = self._cell(self.x[best], self.y[best])
+        if new_cell != old_cell:
+            self._grid[old_cell].remove(best)
+            self._grid.setdefault(new_cell, []).append(best)
+        return best
+
+    def query_radius(self, lat, lon, radius):
+        """Ids of the unique potholes within radius metres of a latitude/longitude"""
+        if self.origin is None:
+            return []
+        x, y = self.project(lat, lon)
+        reach = math.ceil(radius / self.radius)
+        cx, cy = self._cell(x, y)
+        found = []
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                for i in self._grid.get((gx, gy), ()):
+                    if (self.x[i] - x) ** 2 + (self.y[i] - y) ** 2 <= radius * radius:
+                        found.append(i)
+        return found
+
+    def __len__(self):
+        return len(self.x)
+
+    def pothole(self, i):
+        """One unique pothole as a dict"""
+        lat, lon = self.unproject(self.x[i], self.y[i])
+        return {
+            'id': i,
+            'lat': lat,
+            'lon': lon,
+            'detections': self.hits[i],
+            'max_area': self.max_area[i],
+            'first_seen': self.first_filename[i]
+        }
+
+    def write_csv(self, csv_path):
+        """Write the unique potholes as CSV (id, lat, lon, detections, max_area, first_seen)"""
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'lat', 'lon', 'detections', 'max_area', 'first_seen'])
+            for i in range(len(self)):
+                pothole = self.pothole(i)
+                writer.writerow([i, f"{pothole['lat']:.7f}", f"{pothole['lon']:.7f}",
+                                 pothole['detections'], f"{pothole['max_area']:.0f}",
+                                 pothole['first_seen']])
+
+    def write_summary(self, f):
+        """Write the geo section of the text report"""
+        f.write("\nUNIQUE POTHOLES (GEO):\n")
+        f.write("-" * 30 + "\n")
+        f.write(f"Located images: {self.images} ({self.unlocated} without location)\n")
+        f.write(f"Detections indexed: {self.detections}\n")
+        f.write(f"Unique potholes within {self.radius:g} m: {len(self)}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the geo index on random detections")
+    parser.add_argument("--detections", type=int, default=1_000_000, help="detections to index")
+    parser.add_argument("--radius", type=float, default=3.0, help="merge radius in metres")
+    parser.add_argument("--extent", type=float, default=20_000.0, help="survey size in metres")
+    parser.add_argument("--queries", type=int, default=10_000, help="radius queries to time")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    index = GeoIndex(args.radius)
+    index.project(52.0, 5.0)
+    xs = rng.uniform(0, args.extent, args.detections)
+    ys = rng.uniform(0, args.extent, args.detections)
+
+    start = time.perf_counter()
+    for n, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+        index.add(x, y, n, 500.0, "random")
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {args.detections} detections in {elapsed:.1f}s "
+          f"({elapsed / args.detections * 1e6:.1f} µs each), {len(index)} unique")
+
+    centres = [index.unproject(x, y) for x, y in
+               zip(rng.uniform(0, args.extent, args.queries), rng.uniform(0, args.extent, args.queries))]
+    start = time.perf_counter()
+    found = sum(len(index.query_radius(lat, lon, 10.0)) for lat, lon in centres)
+    elapsed = time.perf_counter() - start
+    print(f"{args.queries} queries of 10 m: {elapsed / args.queries * 1e3:.3f} ms each "
+          f"({found / args.queries:.2f} potholes found on average)")
+
+if __name__ == "__main__":
+    main()
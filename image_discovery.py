@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Input discovery for detection batches
+One pass of os.scandir per directory instead of a glob per extension and
+case. Paths are yielded as they are found, so detection can start before a
+large tree has been listed, and every file is yielded once. The input can
+be a folder (optionally recursive), a glob pattern or a list file with one
+path per line
+"""
+import argparse
+import glob
+import os
+import time
+from pathlib import Path, PurePosixPath
+
+# Supported image extensions
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+
+# Leading bytes of the supported formats
+MAGIC_BYTES = [
+    (b"\xff\xd8\xff", 'jpeg'),
+    (b"\x89PNG\r\n\x1a\n", 'png'),
+    (b"BM", 'bmp'),
+    (b"II*\x00", 'tiff'),
+    (b"MM\x00*", 'tiff'),
+]
+
+# Suffixes of list files (one image path per line) given as input
+LIST_SUFFIXES = ('.txt', '.lst')
+
+def sniff_format(path):
+    """Image format from the first bytes of a file ('jpeg', 'png', 'bmp', 'tiff'), or None"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(8)
+    except OSError:
+        return None
+    for magic, name in MAGIC_BYTES:
+        if head.startswith(magic):
+            return name
+    return None
+
+def _is_image(path, sniff):
+    if sniff:
+        return sniff_format(path) is not None
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+def _scan(folder, recursive, sniff, sort):
+    """Image paths in a folder, one scandir per directory, subfolders after the files"""
+    pending = [folder]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                if sort:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+                subfolders = []
+                for entry in entries:
+                    # Symlinked folders are not followed, so a link cycle cannot loop forever
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subfolders.append(entry.path)
+                    elif entry.is_file() and _is_image(entry.path, sniff):
+                        yield entry.path
+        except OSError as error:
+            print(f"Warning: Could not read folder {directory}: {error}")
+            continue
+        # Reversed, so the stack visits them in listing order
+        pending.extend(reversed(subfolders))
+
+def _read_list(list_path):
+    """Paths from a list file; relative ones are relative to the list's folder"""
+    base = os.path.dirname(os.path.abspath(list_path))
+    with open(list_path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield os.path.join(base, line)
+
+def iter_image_files(source, recursive=False, sniff=False, sort=True):
+    """Yield the image files of an input as Path objects, each file once
+
+    source is a folder, a glob pattern (** matches subfolders with
+    recursive=True), a list file (.txt or .lst) or a single image. With
+    sniff=True files are recognised by their first bytes instead of their
+    extension, which finds images with missing or wrong extensions and skips
+    non-images that only look like one by name. With sort=True each folder's
+    entries are sorted by name, so the order does not depend on the
+    filesystem; only one folder's listing is held at a time. List files keep
+    their own order.
+    """
+    source = str(source)
+    if os.path.isdir(source):
+        # A folder scan meets every file once, so there is nothing to deduplicate
+        for path in _scan(source, recursive, sniff, sort):
+            yield Path(path)
+        return
+
+    if glob.has_magic(source):
+        paths = (path for path in glob.iglob(source, recursive=recursive)
+                 if os.path.isfile(path) and _is_image(path, sniff))
+        if sort:
+            paths = iter(sorted(paths))
+    elif source.lower().endswith(LIST_SUFFIXES):
+        # Listed files are taken as given; missing ones fail to load like any bad image
+        paths = _read_list(source)
+    elif os.path.isfile(source):
+        paths = iter([source])
+    else:
+        return
+
+    # Overlapping patterns, lists and paths through symlinked folders can name a file twice
+    seen = set()
+    for path in paths:
+        key = os.path.normcase(os.path.realpath(path))
+        if key in seen:
+            continue
+        seen.add(key)
+        yield Path(path)
+
+def discovery_root(source):
+    """Folder that image names are relative to (see image_name) for an input of iter_image_files
+
+    That is the folder itself, the part of a glob pattern before its first
+    wildcard, or the folder of a list file or single image.
+    """
+    source = str(source)
+    if os.path.isdir(source):
+        return os.path.abspath(source)
+    if glob.has_magic(source):
+        fixed = []
+        for part in Path(source).parts:
+            if glob.has_magic(part):
+                break
+            fixed.append(part)
+        return os.path.abspath(os.path.join(*fixed)) if fixed else os.getcwd()
+    return os.path.dirname(os.path.abspath(source))
+
+def image_name(image_path, root=None):
+    """Name of an image in records and output files
+
+    The path relative to root with / separators, so images with the same
+    file name in different subfolders keep apart. Images outside root keep
+    their whole path without the leading / or drive. Without a root the name
+    is just the file name.
+    """
+    if root is None:
+        return os.path.basename(image_path)
+    path = os.path.abspath(image_path)
+    relative = os.path.relpath(path, root)
+    if relative.startswith(os.pardir):
+        relative = os.path.relpath(path, Path(path).anchor)
+    return Path(relative).as_posix()
+
+def annotated_path(output_folder, filename):
+    """Path of the annotated copy of an image named filename: detected_<file> in its subfolder"""
+    name = PurePosixPath(filename)
+    return Path(output_folder) / name.parent / f"detected_{name.name}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the images a detection run would process")
+    parser.add_argument("source", help="folder, glob pattern or list file")
+    parser.add_argument("--recursive", action="store_true", help="include subfolders")
+    parser.add_argument("--sniff", action="store_true",
+                        help="recognise images by content instead of extension")
+    parser.add_argument("--count", action="store_true", help="only print the number of images")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = 0
+    for path in iter_image_files(args.source, args.recursive, args.sniff):
+        count += 1
+        if not args.count:
+            print(path)
+    print(f"Found {count} image(s) in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
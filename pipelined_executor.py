@@ -0,0 +1,160 @@
+"""
+Pipelined batch executor for the pothole detection pipeline
+Reading, detection and writing run on separate thread pools joined by
+bounded queues, so decoding the next images and encoding the previous
+results overlap with detection instead of stalling it
+"""
+import queue
+import threading
+from pathlib import Path
+
+from image_discovery import annotated_path
+
+# Marks the end of the work for one thread
+_STOP = object()
+
+class PipelinedExecutor:
+    """Run read -> detect -> write as three thread pools
+
+    Each thread owns a detector made by detector_factory (detectors hold
+    working buffers that cannot be shared). cv2.imread, the OpenCV stages
+    and cv2.imwrite all release the GIL, so slow storage keeps the reader and
+    writer threads busy while the detector threads keep working. The queues between the stages hold at
+    most queue_size images each, and no more than max_in_flight images are
+    decoded but not yet handed back, so memory stays bounded however far the
+    readers could run ahead. The paths themselves are taken from the input
+    iterator only as slots free up, so a lazily discovered batch is never
+    listed in full.
+    """
+
+    def __init__(self, detector_factory, output_folder, readers=2, detectors=1, writers=2,
+                 queue_size=4):
+        self.detector_factory = detector_factory
+        self.output_folder = Path(output_folder)
+        self.readers = max(1, readers)
+        self.detectors = max(1, detectors)
+        self.writers = max(1, writers)
+        self.queue_size = max(1, queue_size)
+        self.max_in_flight = self.readers + self.detectors + self.writers + 2 * self.queue_size
+
+    def run(self, image_paths):
+        """Yield (record, events) per image in input order
+
+        record is the compact detection record (None if the image could not
+        be loaded or processed) and events the instrumentation events of that
+        image, or None when the detectors have no EventRecorder hooks.
+        """
+        self._stop = threading.Event()
+        self._slots = threading.Semaphore(self.max_in_flight)
+        self._paths = queue.Queue()
+        self._decoded = queue.Queue(self.queue_size)
+        self._annotated = queue.Queue(self.queue_size)
+        self._done = queue.Queue()
+
+        threads = [threading.Thread(target=self._feed, args=(iter(image_paths),), daemon=True)]
+        threads += [threading.Thread(target=self._stage, args=(self._paths, self._read), daemon=True)
+                    for _ in range(self.readers)]
+        threads += [threading.Thread(target=self._stage, args=(self._decoded, self._detect), daemon=True)
+                    for _ in range(self.detectors)]
+        threads += [threading.Thread(target=self._stage, args=(self._annotated, self._write), daemon=True)
+                    for _ in range(self.writers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Results arrive in completion order; hold them until their turn
+            pending = {}
+            total = None
+            index = 0
+            while total is None or index < total:
+                if index in pending:
+                    yield pending.pop(index)
+                    self._slots.release()
+                    index += 1
+                    continue
+                done_index, item = self._done.get()
+                if done_index is None:
+                    # The feeder has run out of paths; item is how many it handed out
+                    total = item
+                else:
+                    pending[done_index] = item
+        finally:
+            self._stop.set()
+            # Wake threads waiting on an empty queue; a thread that finds a
+            # queued item instead sees the stop flag and exits as well
+            for source, count in ((self._paths, self.readers), (self._decoded, self.detectors),
+                                  (self._annotated, self.writers)):
+                for _ in range(count):
+                    try:
+                        source.put_nowait(_STOP)
+                    except queue.Full:
+                        break
+            for thread in threads:
+                thread.join(timeout=1)
+
+    def _feed(self, image_paths):
+        """Hand out paths with their index, waiting while too many images are in flight"""
+        count = 0
+        try:
+            for image_path in image_paths:
+                while not self._slots.acquire(timeout=0.1):
+                    if self._stop.is_set():
+                        return
+                self._paths.put((count, str(image_path), None))
+                count += 1
+        finally:
+            self._done.put((None, count))
+
+    def _stage(self, source, work):
+        """Thread body: apply work to every item of a queue until told to stop"""
+        detector = self.detector_factory()
+
+        while True:
+            item = source.get()
+            if item is _STOP or self._stop.is_set():
+                return
+            index, path, payload = item
+            try:
+                work(detector, index, path, payload)
+            except Exception as error:
+                # One bad image fails on its own, like a failed load
+                print(f"Error: Could not process image {path}: {error}")
+                self._done.put((index, (None, None)))
+
+    def _events(self, detector, events):
+        """Append this detector's new events to those an image already carries"""
+        if detector.hooks is None:
+            return None
+        return (events or []) + detector.hooks.drain()
+
+    def _read(self, detector, index, path, events):
+        image = detector.read_image(path)
+        if image is None:
+            print(f"Error: Could not load image {path}")
+            self._done.put((index, (None, self._events(detector, events))))
+            return
+        self._put(self._decoded, (index, path, (image, self._events(detector, events))))
+
+    def _detect(self, detector, index, path, payload):
+        image, events = payload
+        record, result_image = detector.annotate(image, path)
+        if result_image is None:
+            # Detections-only mode: nothing to write
+            self._done.put((index, (record, self._events(detector, events))))
+            return
+        self._put(self._annotated, (index, path, (record, result_image, self._events(detector, events))))
+
+    def _write(self, detector, index, path, payload):
+        record, result_image, events = payload
+        output_path = annotated_path(self.output_folder, record['filename'])
+        detector.write_image(output_path, result_image)
+        self._done.put((index, (record, self._events(detector, events))))
+
+    def _put(self, target, item):
+        """Queue an item, giving up if the pipeline is being stopped"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
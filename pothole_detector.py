@@ -1,83 +1,452 @@
 import cv2
 import numpy as np
 import os
-import matplotlib.pyplot as plt
+import argparse
+import collections
+import glob
+import itertools
+import json
+import multiprocessing
+import threading
+import time
 from pathlib import Path
 
+from batch_manifest import BatchManifest
+from contact_sheet import ContactSheetWriter
+from detection_aggregates import BatchCheckpoint, DetectionAggregates
+from detection_cache import DetectionCache
+from detection_store import DetectionStore
+from detector_metrics import EventRecorder, MetricsCollector, replay
+from execution_backend import ExecutionBackend, choose_backend, encode_images
+from camera_calibration import load_calibration
+from geo_index import GeoIndex, GeoLocator, load_location_table
+from image_discovery import (IMAGE_EXTENSIONS, annotated_path, discovery_root, image_name,
+                             iter_image_files)
+from pipelined_executor import PipelinedExecutor
+from detector_config import DetectorConfig, add_config_arguments, config_from_args
+
+# Per-process detector used by the batch worker pool
+_worker_detector = None
+_worker_output_folder = None
+
+def _init_worker(output_folder, config, record_events=False, render=True, keep_contours=None,
+                 threads=1, use_umat=False, input_root=None):
+    """Set up a detector once per worker process"""
+    global _worker_detector, _worker_output_folder
+    # By default each worker gets a single OpenCV thread so the pool does not oversubscribe cores
+    ExecutionBackend(threads=threads, umat=use_umat).apply()
+    _worker_detector = PotholeDetector(config, render=render, keep_contours=keep_contours,
+                                       use_umat=use_umat)
+    _worker_detector.input_root = input_root
+    if record_events:
+        _worker_detector.hooks = EventRecorder()
+    _worker_output_folder = output_folder
+
+def _detect_and_save(image_path):
+    """Worker task: detect potholes, save the annotated image and return a compact record
+    
+    Returns (record, events) where events are the instrumentation events of
+    this image, or None when the parent has no hooks.
+    """
+    record = _worker_detector.detect_and_save(image_path, _worker_output_folder)
+    hooks = _worker_detector.hooks
+    return record, hooks.drain() if hooks is not None else None
+
+def contour_features(contours, area=None):
+    """Compute shape features for a list of contours as NumPy arrays
+    
+    Returns a dict with one entry per contour for area, perimeter, x, y,
+    width, height, circularity and aspect_ratio. The geometry comes straight
+    from cv2.contourArea, cv2.arcLength and cv2.boundingRect, mapped over the
+    list without a Python-level loop, so the values match the scalar calls
+    exactly. Pass area if it has already been computed.
+    """
+    count = len(contours)
+    if area is None:
+        area = np.fromiter(map(cv2.contourArea, contours), dtype=np.float64, count=count)
+    perimeter = np.fromiter(map(cv2.arcLength, contours, itertools.repeat(True)),
+                            dtype=np.float64, count=count)
+    rects = np.array(list(map(cv2.boundingRect, contours)), dtype=np.int64).reshape(-1, 4)
+    width = rects[:, 2]
+    height = rects[:, 3]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        circularity = 4 * np.pi * area / (perimeter * perimeter)
+        aspect_ratio = width / height
+    
+    return {
+        'area': area,
+        'perimeter': perimeter,
+        'x': rects[:, 0],
+        'y': rects[:, 1],
+        'width': width,
+        'height': height,
+        'circularity': circularity,
+        'aspect_ratio': aspect_ratio
+    }
+
+def compact_result(result, contours=False):
+    """Return a copy of a detection result without the image and contour arrays
+    
+    With contours=True each pothole keeps its contour as a list of [x, y]
+    points, which is enough to draw the annotated image later. The image
+    size (width, height) is kept when the result has it.
+    """
+    potholes = []
+    for pothole in result['potholes']:
+        compact = {
+            'area': pothole['area'],
+            'bbox': pothole['bbox'],
+            'circularity': pothole['circularity']
+        }
+        if contours:
+            compact['contour'] = np.asarray(pothole['contour']).reshape(-1, 2).tolist()
+        potholes.append(compact)
+    
+    record = {
+        'path': result['path'],
+        'filename': result['filename'],
+        'pothole_count': result['pothole_count'],
+        'potholes': potholes
+    }
+    if 'width' in result:
+        record['width'] = result['width']
+        record['height'] = result['height']
+    return record
+
+def _write_jpeg(output_path, image):
+    """Save an image as JPEG whatever the file name's extension"""
+    ok, encoded = cv2.imencode('.jpg', image)
+    if ok:
+        with open(output_path, 'wb') as f:
+            f.write(encoded)
+    return ok
+
+def _host_copy(image):
+    """Copy of a stage image as a NumPy array (downloads a cv2.UMat)"""
+    return image.get() if isinstance(image, cv2.UMat) else image.copy()
+
+# Structured detections written instead of annotated images in detections-only mode
+DETECTIONS_FILE = "detections.jsonl"
+
+# Images shown on the visual summary by default; decoding thumbnails for every
+# image of a large batch would take longer than detecting a cached re-run
+SUMMARY_IMAGES = 96
+
+# Number of distinct image shapes whose working buffers are kept per detector
+MAX_BUFFER_SHAPES = 4
+
 class PotholeDetector:
-    def __init__(self):
+    """Pothole detection session
+    
+    The CLAHE object and morphology kernel are built once, and the grayscale,
+    blur, CLAHE, edge and closing stages write into working buffers that are
+    reused for every image of the same size. Because of those shared buffers a
+    detector must not be used from several threads at the same time.
+    
+    hooks is an optional DetectorHooks object (see detector_metrics) that is
+    told the wall time of every stage and counters such as contours found and
+    bytes read. Without hooks the pipeline does no extra work.
+    
+    With render=False the detector only produces structured detections: no
+    annotated image is copied, drawn or encoded, and the batch methods write
+    the records (with contour points) to detections.jsonl instead.
+    render_detections() draws the annotated images later, on request.
+    keep_contours (default: only without rendering) makes compact records
+    keep their contour points, e.g. for a DetectionStore.
+    
+    With capture_intermediates=True every find_potholes call leaves the
+    enhanced, edges and closed stage images (copies of the working buffers),
+    all contours and one rejection reason per contour (None for kept ones) in
+    self.intermediates. These are in the coordinates of the processed image,
+    which differ from the input with config.scale < 1. Off by default: the
+    pipeline then skips the copies and the bookkeeping.
+    
+    With use_umat=True the stages from grayscale to closing run on cv2.UMat
+    (OpenCV's transparent API): on OpenCL devices when OpenCL is enabled (see
+    execution_backend), on the CPU otherwise, with the same results. OpenCV
+    then allocates the stage outputs instead of reusing working buffers.
+    
+    calibration is an optional CameraCalibration (see camera_calibration)
+    for the rig that took the images. Every added result then gets each
+    pothole's ground-plane area (area_sqm) and position, and the report's
+    areas and severity statistics are in square metres.
+    
+    input_root is the folder image names are taken relative to; process_images
+    sets it to the input, so images with the same file name in different
+    subfolders get their own records and annotated outputs (mirrored
+    subfolders under the output folder). Without it the name is the file name.
+    """
+    
+    def __init__(self, config=None, hooks=None, render=True, keep_contours=None,
+                 capture_intermediates=False, use_umat=False, calibration=None, input_root=None):
         self.results = []
+        # Running totals and histograms, updated as each result is added
+        self.aggregates = DetectionAggregates()
+        self.config = config or DetectorConfig()
+        self.hooks = hooks
+        self.render = render
+        self.keep_contours = not render if keep_contours is None else keep_contours
+        self.capture_intermediates = capture_intermediates
+        self.intermediates = None
+        self.use_umat = use_umat
+        self.calibration = calibration
+        # Images on the visual summary (the first ones of the batch); None shows all, 0 none
+        self.summary_images = SUMMARY_IMAGES
+        # Records and outputs are named by the path below this folder (see image_name)
+        self.input_root = input_root
+        
+        # Built once per session instead of once per image
+        grid = self.config.clahe_grid
+        self.clahe = cv2.createCLAHE(clipLimit=self.config.clahe_clip_limit, tileGridSize=(grid, grid))
+        size = self.config.morph_kernel
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+        
+        # Working buffers keyed by (height, width), oldest shape evicted first
+        self._buffers = {}
+        
+        # Downscaling filter for config.scale < 1; INTER_AREA averages away texture noise
+        self.interpolation = cv2.INTER_AREA
+    
+    def fingerprint(self):
+        """Return a stable hash of everything that determines the detection results"""
+        return f"{self.config.fingerprint()}-cv{cv2.__version__}"
+    
+    def _working_buffers(self, shape):
+        """Return the preallocated stage buffers for an image of the given size"""
+        key = shape[:2]
+        buffers = self._buffers.get(key)
+        if buffers is None:
+            if len(self._buffers) >= MAX_BUFFER_SHAPES:
+                del self._buffers[next(iter(self._buffers))]
+            buffers = {
+                name: np.empty(key, dtype=np.uint8)
+                for name in ('gray', 'blurred', 'enhanced', 'edges', 'closed')
+            }
+            self._buffers[key] = buffers
+        return buffers
+    
+    def _buffer(self, image, name):
+        """Working buffer for a stage output, or None for UMat input (OpenCV allocates)"""
+        if isinstance(image, cv2.UMat):
+            return None
+        return self._working_buffers(image.shape)[name]
+    
+    def _timed(self, name, function, *args):
+        """Run one pipeline stage, reporting its wall time to the hooks if there are any"""
+        hooks = self.hooks
+        if hooks is None:
+            return function(*args)
+        start = time.perf_counter()
+        value = function(*args)
+        hooks.on_stage(name, time.perf_counter() - start)
+        return value
+    
+    def read_image(self, image_path):
+        """Decode an image file (the 'read' stage)"""
+        image = self._timed('read', cv2.imread, str(image_path))
+        if image is not None and self.hooks is not None:
+            self.hooks.on_count('images', 1)
+            self.hooks.on_count('bytes_read', os.path.getsize(image_path))
+        return image
+    
+    def write_image(self, output_path, image):
+        """Encode and save an annotated image (the 'write' stage)"""
+        # Images from subfolders are written to the same subfolders of the output
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        if Path(output_path).suffix.lower() in IMAGE_EXTENSIONS:
+            self._timed('write', cv2.imwrite, str(output_path), image)
+        else:
+            # Images found by --sniff keep their name; without an image extension they are saved as JPEG
+            self._timed('write', _write_jpeg, output_path, image)
+        if self.hooks is not None:
+            self.hooks.on_count('bytes_written', os.path.getsize(output_path))
     
     def preprocess_image(self, image):
-        """Preprocess the image for better pothole detection"""
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        """Preprocess the image for better pothole detection
+        
+        The returned array is a reused working buffer; copy it if it has to
+        outlive the next call on this detector.
+        """
+        gray_input = image.ndim == 2
+        if self.use_umat:
+            image = cv2.UMat(image)
+        
+        # Convert to grayscale (single-channel input is already gray)
+        if gray_input:
+            gray = image
+        else:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self._buffer(image, 'gray'))
         
         # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        size = self.config.blur_kernel
+        blurred = cv2.GaussianBlur(gray, (size, size), 0, dst=self._buffer(gray, 'blurred'))
         
         # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(blurred)
+        enhanced = self.clahe.apply(blurred, dst=self._buffer(blurred, 'enhanced'))
         
         return enhanced
     
     def detect_potholes(self, image_path):
         """Main function to detect potholes in an image"""
         # Read the image
-        image = cv2.imread(image_path)
+        image = self.read_image(image_path)
         if image is None:
             print(f"Error: Could not load image {image_path}")
             return None
         
-        original = image.copy()
+        # The pipeline never writes to the input, so it doubles as the original
+        original = image
+        potholes = self.find_potholes(image)
+        result_image = None
+        if self.render:
+            result_image = self._timed('drawing', self.draw_potholes, original, potholes)
+        
+        return {
+            'original': original,
+            'result': result_image,
+            'pothole_count': len(potholes),
+            'potholes': potholes,
+            'path': str(image_path),
+            'filename': image_name(image_path, self.input_root),
+            'width': image.shape[1],
+            'height': image.shape[0]
+        }
+    
+    def find_potholes(self, image):
+        """Run preprocessing, edge detection and contour filtering on a BGR image
+        
+        With config.scale < 1 the pipeline runs on a downscaled copy; the
+        returned potholes are always in the coordinates of the input image.
+        """
+        scale = self.config.scale
+        if scale != 1:
+            image = self._timed('resize', cv2.resize, image, None, None, scale, scale,
+                                self.interpolation)
+        
         height, width = image.shape[:2]
+        contours = self.find_contours(image)
+        potholes = self._timed('filtering', self.filter_contours, contours, width, height, scale)
         
+        if self.hooks is not None:
+            self.hooks.on_count('contours_found', len(contours))
+            self.hooks.on_count('contours_kept', len(potholes))
+        
+        if scale != 1:
+            for pothole in potholes:
+                pothole['contour'] = np.round(pothole['contour'] / scale).astype(np.int32)
+                pothole['area'] = pothole['area'] / (scale * scale)
+                pothole['bbox'] = tuple(int(round(v / scale)) for v in pothole['bbox'])
+        
+        return potholes
+    
+    def find_contours(self, image):
+        """Run preprocessing, edge detection and closing, and return the outer contours"""
         # Preprocess the image
-        processed = self.preprocess_image(image)
+        processed = self._timed('preprocess', self.preprocess_image, image)
         
         # Edge detection using Canny
-        edges = cv2.Canny(processed, 50, 150)
+        edges = self._timed('canny', self.detect_edges, processed)
         
         # Morphological operations to close gaps in edges
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
+        closed = self._timed('morphology', self.close_edges, edges)
+        
+        if isinstance(closed, cv2.UMat):
+            # Contour tracing runs on the CPU and needs the mask there
+            closed = closed.get()
         
         # Find contours
-        contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours, _ = self._timed('contours', cv2.findContours, closed, cv2.RETR_EXTERNAL,
+                                  cv2.CHAIN_APPROX_SIMPLE)
+        
+        if self.capture_intermediates:
+            self.intermediates = {
+                'enhanced': _host_copy(processed),
+                'edges': _host_copy(edges),
+                'closed': _host_copy(closed),
+                'contours': contours
+            }
+        
+        return contours
+    
+    def detect_edges(self, processed):
+        """Canny edge detection on the preprocessed image (into a working buffer)"""
+        return cv2.Canny(processed, self.config.canny_low, self.config.canny_high,
+                         edges=self._buffer(processed, 'edges'))
+    
+    def close_edges(self, edges):
+        """Morphological closing to connect broken edge segments (into a working buffer)"""
+        return cv2.morphologyEx(edges, cv2.MORPH_CLOSE, self.kernel,
+                                dst=self._buffer(edges, 'closed'))
+    
+    def filter_contours(self, contours, width, height, scale=1.0):
+        """Keep the contours whose size and shape look like a pothole
+        
+        Areas are computed for every contour first; the remaining features are
+        only needed for the few contours inside the size range. The shape
+        thresholds are then applied to the feature arrays as one mask. scale is
+        the size of the processed image relative to the input image, and the
+        pixel thresholds are scaled by it.
+        """
+        config = self.config
+        min_area = config.min_area * scale * scale  # Minimum area for a pothole
+        max_area = width * height * config.max_area_fraction  # Maximum area (fraction of image)
+        min_size = config.min_size * scale
+        
+        area = np.fromiter(map(cv2.contourArea, contours), dtype=np.float64, count=len(contours))
+        candidates = np.flatnonzero((min_area < area) & (area < max_area))
+        
+        features = contour_features([contours[i] for i in candidates], area[candidates])
+        checks = self._shape_checks(features, min_size)
+        keep = np.logical_and.reduce([passed for _, passed in checks])
+        
+        if self.capture_intermediates:
+            self._capture_rejections(area, min_area, max_area, candidates, checks)
         
-        # Filter contours based on area and shape
         potholes = []
-        min_area = 200  # Minimum area for a pothole
-        max_area = width * height * 0.3  # Maximum area (30% of image)
+        for i in np.flatnonzero(keep):
+            potholes.append({
+                'contour': contours[candidates[i]],
+                'area': float(features['area'][i]),
+                'bbox': (int(features['x'][i]), int(features['y'][i]),
+                         int(features['width'][i]), int(features['height'][i])),
+                'circularity': float(features['circularity'][i])
+            })
         
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            
-            if min_area < area < max_area:
-                # Calculate additional features
-                perimeter = cv2.arcLength(contour, True)
-                if perimeter > 0:
-                    circularity = 4 * np.pi * area / (perimeter * perimeter)
-                    
-                    # Get bounding rectangle
-                    x, y, w, h = cv2.boundingRect(contour)
-                    aspect_ratio = float(w) / h
-                    
-                    # Filter based on shape characteristics
-                    if (0.1 < circularity < 1.2 and 
-                        0.3 < aspect_ratio < 3.0 and
-                        w > 20 and h > 20):
-                        
-                        potholes.append({
-                            'contour': contour,
-                            'area': area,
-                            'bbox': (x, y, w, h),
-                            'circularity': circularity
-                        })
+        return potholes
+    
+    def _shape_checks(self, features, min_size):
+        """(rejection reason, pass mask) for each shape filter, in the order they are reported"""
+        config = self.config
+        circularity = features['circularity']
+        aspect_ratio = features['aspect_ratio']
+        return [
+            ('zero_perimeter', features['perimeter'] > 0),
+            ('circularity', (config.min_circularity < circularity) &
+                            (circularity < config.max_circularity)),
+            ('aspect_ratio', (config.min_aspect_ratio < aspect_ratio) &
+                             (aspect_ratio < config.max_aspect_ratio)),
+            ('too_narrow', (features['width'] > min_size) & (features['height'] > min_size)),
+        ]
+    
+    def _capture_rejections(self, area, min_area, max_area, candidates, checks):
+        """Record the first failed filter of every contour in self.intermediates"""
+        reasons = ['too_small' if a <= min_area else 'too_large' for a in area]
+        for n, i in enumerate(candidates):
+            reasons[i] = next((reason for reason, passed in checks if not passed[n]), None)
         
-        # Draw detected potholes
-        result_image = original.copy()
+        if self.intermediates is None:
+            self.intermediates = {}
+        self.intermediates['rejections'] = reasons
+        self.intermediates['area_range'] = (min_area, max_area)
+    
+    def draw_potholes(self, image, potholes, in_place=False):
+        """Return the image with the detected potholes marked
+        
+        Draws on a copy unless in_place is set, in which case the input image
+        itself is annotated and returned.
+        """
+        result_image = image if in_place else image.copy()
         
         for i, pothole in enumerate(potholes):
             # Draw contour
@@ -97,33 +466,125 @@ class PotholeDetector:
         cv2.putText(result_image, summary_text, (10, 30), 
                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
         
-        return {
-            'original': original,
-            'result': result_image,
-            'pothole_count': len(potholes),
-            'potholes': potholes,
-            'filename': os.path.basename(image_path)
-        }
+        return result_image
     
-    def process_images(self, input_folder, output_folder):
-        """Process all images in the input folder"""
-        # Create output folder if it doesn't exist
-        Path(output_folder).mkdir(parents=True, exist_ok=True)
+    def process_images(self, input_folder, output_folder, workers=1, chunksize=None, stream=False,
+                       cache=None, io_threads=0, store=None, checkpoint=None, manifest=None,
+                       threads=1, geo=None, recursive=False, sniff=False, sort=True):
+        """Process all images in the input folder
+        
+        input_folder may also be a glob pattern or a list file; the images are
+        found by iter_image_files (with recursive, sniff and sort passed on)
+        and fed to detection as they are found. Only the process pool without
+        a chunksize, the cache and the checkpoint/manifest need the whole list
+        up front.
+        
+        With workers > 1 the images are spread over a process pool. Workers save
+        the annotated images themselves and send back only compact records (see
+        compact_result), in input order. With stream=True the serial path does the
+        same, so self.results holds records instead of full images and memory
+        stays flat however large the batch is. A DetectionCache (see
+        iter_detections) also switches to compact records, and so does
+        io_threads > 0, which overlaps reading and writing with detection.
+        Without rendering the records are also written to detections.jsonl.
+        Every result is also added to store (a DetectionStore) if one is given.
         
-        # Supported image extensions
-        extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+        With a BatchCheckpoint, images already in its journal are skipped and
+        their records reused, and every new record is journaled as it arrives,
+        so a batch that died part way continues where it stopped. A
+        BatchManifest logs the outcome and timing of every image; images that
+        failed too often in earlier runs are skipped, the others are retried.
         
-        # Find all image files
-        image_files = []
-        for ext in extensions:
-            image_files.extend(Path(input_folder).glob(f'*{ext}'))
-            image_files.extend(Path(input_folder).glob(f'*{ext.upper()}'))
+        threads is the number of OpenCV threads in each worker process.
+        
+        With a GeoIndex every result gets the image's location and its
+        potholes are merged with those seen nearby in other images; the report
+        then counts unique potholes and lists them in unique_potholes.csv.
+        """
+        # Create output folder if it doesn't exist
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
         
-        if not image_files:
+        self.input_root = discovery_root(input_folder)
+        image_files = iter_image_files(input_folder, recursive, sniff, sort)
+        first = next(image_files, None)
+        if first is None:
             print(f"No image files found in {input_folder}")
             return
+        image_files = itertools.chain([first], image_files)
+        
+        print(f"Processing images from {input_folder} as they are found...")
+        
+        if checkpoint is not None:
+            # Per-image records stay in the journal; the report needs only the aggregates
+            self.aggregates = checkpoint.aggregates
+            if geo is not None:
+                # Journaled records already carry their location
+                for record in checkpoint.iter_records():
+                    geo.add_record(record)
+            done = checkpoint.completed()
+            if done:
+                image_files = [image_path for image_path in image_files
+                               if os.path.abspath(image_path) not in done]
+                print(f"Resuming: {checkpoint.journaled} image(s) already processed, "
+                      f"{len(image_files)} to go")
         
-        print(f"Found {len(image_files)} image(s) to process...")
+        if manifest is not None:
+            completed = done if checkpoint is not None else None
+            image_files, given_up = manifest.pending(image_files, completed)
+            if given_up:
+                print(f"Skipping {given_up} image(s) that failed {manifest.max_attempts} time(s)")
+        
+        if (workers > 1 or stream or cache is not None or io_threads > 0 or not self.render or
+                checkpoint is not None or manifest is not None):
+            # The detectors take paths ahead of the results (on their own threads,
+            # so no tee); the paths in flight wait here for their records
+            in_flight = collections.deque()
+            
+            def detect_files():
+                for image_path in image_files:
+                    in_flight.append(image_path)
+                    yield image_path
+            
+            records = self.iter_detections(detect_files(), output_folder, workers, chunksize, cache,
+                                           io_threads, threads)
+            detections_file = None
+            if not self.render:
+                # A resumed batch keeps the detections written before it stopped
+                mode = 'a' if checkpoint is not None and checkpoint.journaled else 'w'
+                detections_file = open(Path(output_folder) / DETECTIONS_FILE, mode)
+            
+            try:
+                finished = time.perf_counter()
+                for record in records:
+                    image_path = in_flight.popleft()
+                    print(f"\nProcessed: {image_path.name}")
+                    
+                    if record:
+                        self.add_result(record, store, checkpoint, geo)
+                        print(f"  - Potholes detected: {record['pothole_count']}")
+                        
+                        if detections_file is None:
+                            output_path = annotated_path(output_folder, record['filename'])
+                            print(f"  - Output saved: {output_path}")
+                        else:
+                            output_path = Path(output_folder) / DETECTIONS_FILE
+                            detections_file.write(json.dumps(record) + "\n")
+                    
+                    if manifest is not None:
+                        # Time since the previous image finished (per image when serial)
+                        now = time.perf_counter()
+                        manifest.finished(image_path, output_path if record else None,
+                                          now - finished, ok=record is not None)
+                        finished = now
+            finally:
+                if detections_file is not None:
+                    detections_file.close()
+            
+            if detections_file is not None:
+                print(f"\nDetections saved: {Path(output_folder) / DETECTIONS_FILE}")
+            
+            self.generate_summary_report(output_folder, geo, checkpoint)
+            return
         
         for image_path in image_files:
             print(f"\nProcessing: {image_path.name}")
@@ -132,42 +593,260 @@ class PotholeDetector:
             
             if result:
                 # Save the result image
-                output_path = Path(output_folder) / f"detected_{result['filename']}"
-                cv2.imwrite(str(output_path), result['result'])
+                output_path = annotated_path(output_folder, result['filename'])
+                self.write_image(output_path, result['result'])
                 
-                self.results.append(result)
+                self.add_result(result, store, geo=geo)
                 
                 print(f"  - Potholes detected: {result['pothole_count']}")
                 print(f"  - Output saved: {output_path}")
         
-        self.generate_summary_report(output_folder)
+        self.generate_summary_report(output_folder, geo)
     
-    def generate_summary_report(self, output_folder):
-        """Generate a summary report of all detections"""
-        if not self.results:
-            return
+    def add_result(self, result, store=None, checkpoint=None, geo=None):
+        """Keep a result and update its calibrated areas, the aggregates, geo index, store and checkpoint
+
+        With a checkpoint the journal holds every record, so only the ones the
+        visual summary shows are kept in self.results.
+        """
+        if (checkpoint is None or self.summary_images is None or
+                len(self.results) < self.summary_images):
+            self.results.append(result)
+        if self.calibration is not None:
+            # Before the geo index, which places potholes by their ground position
+            self.calibration.annotate(result)
+        if geo is not None:
+            # Sets result['location'] first, so the store and the journal keep it
+            geo.add_record(result)
+        if checkpoint is not None:
+            # Journals the record and updates the shared aggregates; before the
+            # store, so a resumed batch can tell which journaled images it lost
+            checkpoint.add(result)
+        else:
+            self.aggregates.update(result)
+        if store is not None:
+            store.add(result)
+    
+    def detect_and_save(self, image_path, output_folder):
+        """Detect potholes, save the annotated image and return only the compact record
+        
+        The full result (with its image arrays) is dropped before returning, so
+        callers never hold more than one image at a time. Without rendering
+        nothing is saved and the record carries the contour points.
+        """
+        image = self.read_image(image_path)
+        if image is None:
+            print(f"Error: Could not load image {image_path}")
+            return None
+        
+        try:
+            record, result_image = self.annotate(image, image_path)
+            if result_image is not None:
+                output_path = annotated_path(output_folder, record['filename'])
+                self.write_image(output_path, result_image)
+        except Exception as error:
+            # One bad image should not end a batch of thousands
+            print(f"Error: Could not process image {image_path}: {error}")
+            return None
+        
+        return record
+    
+    def annotate(self, image, image_path):
+        """Detect potholes in a decoded image and mark them on it in place
+        
+        Returns (compact record, annotated image). Without rendering nothing is
+        drawn, the annotated image is None and the record keeps the contours.
+        """
+        potholes = self.find_potholes(image)
+        record = compact_result({
+            'path': str(image_path),
+            'filename': image_name(image_path, self.input_root),
+            'width': image.shape[1],
+            'height': image.shape[0],
+            'pothole_count': len(potholes),
+            'potholes': potholes
+        }, contours=self.keep_contours)
+        
+        if not self.render:
+            return record, None
+        
+        # The original is not kept, so annotate the decoded image without copying it
+        result_image = self._timed('drawing', self.draw_potholes, image, potholes, True)
+        return record, result_image
+    
+    def render_detections(self, output_folder, filenames=None):
+        """Draw annotated images from the records in detections.jsonl
+        
+        Renders the images named in filenames, or all of them, from the
+        original image and the stored contours without running detection
+        again. Returns the paths of the saved images.
+        """
+        wanted = set(filenames) if filenames else None
+        saved = []
+        with open(Path(output_folder) / DETECTIONS_FILE) as f:
+            for line in f:
+                record = json.loads(line)
+                if wanted is not None and record['filename'] not in wanted:
+                    continue
+                
+                image = self.read_image(record['path'])
+                if image is None:
+                    print(f"Error: Could not load image {record['path']}")
+                    continue
+                
+                potholes = [
+                    {'contour': np.array(pothole['contour'], dtype=np.int32).reshape(-1, 1, 2),
+                     'bbox': tuple(pothole['bbox'])}
+                    for pothole in record['potholes']
+                ]
+                result_image = self._timed('drawing', self.draw_potholes, image, potholes, True)
+                output_path = annotated_path(output_folder, record['filename'])
+                self.write_image(output_path, result_image)
+                saved.append(output_path)
+        return saved
+    
+    def iter_detections(self, image_files, output_folder, workers=1, chunksize=None, cache=None,
+                        io_threads=0, threads=1):
+        """Yield one compact record per input image (None if it failed to load), in input order
         
-        # Create a figure with subplots
-        n_images = len(self.results)
-        fig, axes = plt.subplots(2, n_images, figsize=(5*n_images, 10))
+        With a DetectionCache, images whose record is cached (and whose annotated
+        output is still the one rendered from that record) are not decoded at
+        all; only the misses are run through the detector and their records
+        are added to the cache.
         
-        if n_images == 1:
-            axes = axes.reshape(2, 1)
+        With io_threads > 0 the images go through a PipelinedExecutor instead:
+        io_threads reader threads and io_threads writer threads around workers
+        detector threads, so slow storage does not stall detection.
+        """
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+        
+        if cache is not None:
+            image_files = list(image_files)
+            cached = []
+            outputs = []
+            for image_path in image_files:
+                name = image_name(image_path, self.input_root)
+                # Another run (other settings) may have overwritten the annotated image
+                output_path = annotated_path(output_folder, name) if self.render else None
+                record = cache.lookup(image_path, output_path)
+                if record is not None:
+                    # The cache names records by file name only
+                    record['filename'] = name
+                cached.append(record)
+                outputs.append(output_path)
+            
+            misses = [image_path for image_path, record in zip(image_files, cached) if record is None]
+            if self.hooks is not None:
+                self.hooks.on_count('cache_hits', len(image_files) - len(misses))
+            fresh = self.iter_detections(misses, output_folder, workers, chunksize,
+                                         io_threads=io_threads, threads=threads)
+            
+            for image_path, record, output_path in zip(image_files, cached, outputs):
+                if record is None:
+                    record = next(fresh)
+                    if record is not None:
+                        cache.store(image_path, record, output_path)
+                yield record
+            return
         
-        for i, result in enumerate(self.results):
-            # Original image
-            axes[0, i].imshow(cv2.cvtColor(result['original'], cv2.COLOR_BGR2RGB))
-            axes[0, i].set_title(f"Original: {result['filename']}")
-            axes[0, i].axis('off')
+        hooks = self.hooks
+        
+        if io_threads > 0:
+            def make_detector():
+                return PotholeDetector(self.config, EventRecorder() if hooks is not None else None,
+                                       render=self.render, keep_contours=self.keep_contours,
+                                       use_umat=self.use_umat, input_root=self.input_root)
             
-            # Result image
-            axes[1, i].imshow(cv2.cvtColor(result['result'], cv2.COLOR_BGR2RGB))
-            axes[1, i].set_title(f"Detected: {result['pothole_count']} potholes")
-            axes[1, i].axis('off')
+            executor = PipelinedExecutor(make_detector, output_folder, readers=io_threads,
+                                         detectors=workers, writers=io_threads)
+            for record, events in executor.run(image_files):
+                if events:
+                    replay(events, hooks)
+                yield record
+            return
+        
+        if workers <= 1:
+            for image_path in image_files:
+                yield self.detect_and_save(image_path, output_folder)
+            return
+        
+        if chunksize is None:
+            # A few chunks per worker keeps the pool balanced without much IPC overhead
+            image_files = list(image_files)
+            chunksize = max(1, len(image_files) // (workers * 4))
+        
+        print(f"Using {workers} worker processes (chunk size {chunksize})")
+        
+        # With a given chunksize the paths stream into the pool as they are found.
+        # imap would read them all at once, so a path takes a slot that its
+        # result gives back and at most two chunks per worker are ahead
+        slots = threading.Semaphore(2 * workers * chunksize)
+        stop = threading.Event()
+        
+        def paths():
+            for image_path in image_files:
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                yield str(image_path)
+        
+        initargs = (output_folder, self.config, hooks is not None, self.render, self.keep_contours,
+                    threads, self.use_umat, self.input_root)
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            try:
+                # imap yields results in submission order, so the report stays deterministic
+                for record, events in pool.imap(_detect_and_save, paths(), chunksize):
+                    slots.release()
+                    if events:
+                        replay(events, hooks)
+                    yield record
+            finally:
+                # Lets the pool's feeder thread finish before the pool is shut down
+                stop.set()
+    
+    def generate_summary_report(self, output_folder, geo=None, checkpoint=None):
+        """Generate a summary report of all detections
+        
+        With a MetricsCollector attached, its metrics are saved next to the
+        report as detection_metrics.json. Without rendering there are no
+        annotated images, so only the text report is written. The visual
+        summary shows the first summary_images images only, so its cost does
+        not grow with the batch. With a GeoIndex
+        the unique potholes are counted in the report and saved as
+        unique_potholes.csv. With a BatchCheckpoint the report is built from
+        the aggregates alone and refers to the journal for per-image results.
+        """
+        if not self.results and not self.aggregates.images:
+            return
+        
+        summary_start = time.perf_counter()
+        
+        if checkpoint is None and self.aggregates.images != len(self.results):
+            # Results were added directly rather than through add_result
+            self.aggregates = DetectionAggregates()
+            for result in self.results:
+                self.aggregates.update(result)
         
-        plt.tight_layout()
-        plt.savefig(Path(output_folder) / "detection_summary.png", dpi=150, bbox_inches='tight')
-        plt.close()
+        summary_pages = []
+        shown = self.results if self.summary_images is None else self.results[:self.summary_images]
+        if self.render and shown:
+            # Lay out downscaled before/after thumbnails on fixed-size contact sheet pages
+            sheet = ContactSheetWriter(output_folder, len(shown))
+            
+            for result in shown:
+                # Compact records carry no images, so the thumbnails are decoded from disk
+                original = result.get('original')
+                if original is None:
+                    original = result['path']
+                result_image = result.get('result')
+                if result_image is None:
+                    result_image = annotated_path(output_folder, result['filename'])
+                
+                sheet.add(original, result_image,
+                          f"Original: {result['filename']}",
+                          f"Detected: {result['pothole_count']} potholes")
+            
+            summary_pages = sheet.close()
         
         # Generate text report
         report_path = Path(output_folder) / "detection_report.txt"
@@ -175,50 +854,232 @@ class PotholeDetector:
             f.write("POTHOLE DETECTION REPORT\n")
             f.write("=" * 50 + "\n\n")
             
-            total_potholes = sum(r['pothole_count'] for r in self.results)
-            f.write(f"Total images processed: {len(self.results)}\n")
-            f.write(f"Total potholes detected: {total_potholes}\n\n")
+            # Totals, histograms and the largest potholes come from the running aggregates
+            self.aggregates.write_summary(f)
+            if geo is not None:
+                geo.write_summary(f)
             
-            f.write("DETAILED RESULTS:\n")
+            f.write("\nDETAILED RESULTS:\n")
             f.write("-" * 30 + "\n")
             
-            for result in self.results:
-                f.write(f"\nImage: {result['filename']}\n")
-                f.write(f"Potholes detected: {result['pothole_count']}\n")
+            if checkpoint is not None:
+                # Per-image detail would mean a pass over the whole batch
+                f.write(f"One JSON record per image in {checkpoint.journal_path.name}\n")
+            else:
+                for result in self.results:
+                    f.write(f"\nImage: {result['filename']}\n")
+                    f.write(f"Potholes detected: {result['pothole_count']}\n")
+                    location = result.get('location')
+                    if location is not None:
+                        f.write(f"Location: {location['lat']:.6f}, {location['lon']:.6f}\n")
                 
-                for i, pothole in enumerate(result['potholes']):
-                    area_sqm = pothole['area'] / 10000  # Rough conversion to square meters
-                    f.write(f"  Pothole {i+1}: Area = {pothole['area']:.0f} pixels (~{area_sqm:.2f} sq.m)\n")
+                    for i, pothole in enumerate(result['potholes']):
+                        if 'area_sqm' in pothole:
+                            area_text = f"{pothole['area_sqm']:.3f} sq.m"
+                        else:
+                            area_sqm = pothole['area'] / 10000  # Rough conversion to square meters
+                            area_text = f"~{area_sqm:.2f} sq.m"
+                        f.write(f"  Pothole {i+1}: Area = {pothole['area']:.0f} pixels ({area_text})\n")
         
         print(f"\nSummary report generated: {report_path}")
-        print(f"Visual summary saved: {Path(output_folder) / 'detection_summary.png'}")
+        if geo is not None:
+            geo_path = Path(output_folder) / "unique_potholes.csv"
+            geo.write_csv(geo_path)
+            print(f"Unique potholes: {len(geo)} within {geo.radius:g} m ({geo_path})")
+        if len(summary_pages) == 1:
+            print(f"Visual summary saved: {summary_pages[0]}")
+        elif summary_pages:
+            print(f"Visual summary saved: {len(summary_pages)} pages ({summary_pages[0].name} ...)")
+        if summary_pages and len(shown) < self.aggregates.images:
+            print(f"   (first {len(shown)} of {self.aggregates.images} images; see --summary-images)")
+        
+        if isinstance(self.hooks, MetricsCollector):
+            self.hooks.on_stage('summary', time.perf_counter() - summary_start)
+            metrics_path = Path(output_folder) / "detection_metrics.json"
+            self.hooks.save(metrics_path)
+            print(f"Metrics saved: {metrics_path}")
+
+def parse_args(argv=None):
+    """Parse command line options for the detection run"""
+    parser = argparse.ArgumentParser(description="Detect potholes in road images")
+    parser.add_argument("--input", default="input_images",
+                        help="folder with road images, a glob pattern or a list file (.txt/.lst)")
+    parser.add_argument("--recursive", action="store_true",
+                        help="include images in subfolders (and let ** match them in patterns)")
+    parser.add_argument("--sniff", action="store_true",
+                        help="recognise images by their first bytes instead of their extension")
+    parser.add_argument("--unsorted", action="store_true",
+                        help="process images in directory order as they are found, without "
+                             "sorting each folder first")
+    parser.add_argument("--output", default="output_results", help="folder for results")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes (default: 1, serial)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="OpenCV threads per process (default: 1 with --workers, "
+                             "otherwise one per core)")
+    parser.add_argument("--umat", action="store_true",
+                        help="run the pipeline on cv2.UMat (OpenCL when available)")
+    parser.add_argument("--auto-backend", action="store_true",
+                        help="time processes vs. OpenCV threads (and UMat) on a few input "
+                             "images and use the fastest; overrides --workers, --threads, --umat")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="images per task sent to each worker (default: automatic)")
+    parser.add_argument("--stream", action="store_true",
+                        help="keep only compact detection records in memory instead of full images")
+    parser.add_argument("--cache-dir", default=None,
+                        help="reuse detection results for unchanged images from this folder")
+    parser.add_argument("--cache-size-mb", type=int, default=1024,
+                        help="maximum size of the result cache (default: 1024)")
+    parser.add_argument("--io-threads", type=int, default=0,
+                        help="reader and writer threads around the detectors; with this set, "
+                             "--workers counts detector threads (default: 0, no pipelining)")
+    parser.add_argument("--detections-only", action="store_true",
+                        help="write structured detections to detections.jsonl instead of "
+                             "annotated images")
+    parser.add_argument("--render", nargs="*", default=None, metavar="FILENAME",
+                        help="draw annotated images from a detections-only run in --output "
+                             "(all images, or only the named ones) and exit")
+    parser.add_argument("--summary-images", type=int, default=SUMMARY_IMAGES,
+                        help=f"images shown on the visual summary, 0 for none, -1 for all "
+                             f"(default: {SUMMARY_IMAGES})")
+    parser.add_argument("--store", default=None,
+                        help="also append one row per pothole to a columnar store in this folder")
+    parser.add_argument("--store-contours", action="store_true",
+                        help="keep simplified contours in the --store folder")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="journal finished images and log every image's status in "
+                             "batch_manifest.jsonl in the output folder")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted --checkpoint batch: skip finished "
+                             "images and retry failed ones")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="attempts per image across resumed runs (default: 3)")
+    parser.add_argument("--checkpoint-every", type=int, default=50,
+                        help="images between aggregate checkpoints (default: 50)")
+    parser.add_argument("--calibration", default=None, metavar="PROFILE",
+                        help="camera rig calibration profile (JSON) for areas in square metres")
+    parser.add_argument("--geo", action="store_true",
+                        help="locate images (--gps-csv, <image>.json sidecar or EXIF GPS) "
+                             "and count unique potholes across overlapping images")
+    parser.add_argument("--gps-csv", default=None,
+                        help="CSV with filename, lat, lon (and optional heading) per image; "
+                             "implies --geo")
+    parser.add_argument("--merge-radius", type=float, default=3.0,
+                        help="detections closer than this many metres are one pothole "
+                             "(default: 3.0)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record per-stage timings and counters in detection_metrics.json")
+    add_config_arguments(parser)
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    
     print("POTHOLE DETECTION SYSTEM")
     print("=" * 40)
     
     # Initialize detector
-    detector = PotholeDetector()
+    hooks = MetricsCollector() if args.metrics else None
+    detector = PotholeDetector(config_from_args(args), hooks=hooks,
+                               render=not args.detections_only,
+                               keep_contours=True if args.store_contours else None)
+    detector.summary_images = None if args.summary_images < 0 else args.summary_images
+    
+    if args.render is not None:
+        # Lazy rendering of an earlier detections-only run
+        saved = detector.render_detections(args.output, args.render)
+        print(f"\n✅ Rendered {len(saved)} annotated image(s) into '{args.output}'")
+        return
     
     # Set up directories
-    input_folder = "input_images"
-    output_folder = "output_results"
+    input_folder = args.input
+    output_folder = args.output
     
-    # Create input folder if it doesn't exist
-    Path(input_folder).mkdir(exist_ok=True)
+    # Create input folder if it doesn't exist (unless the input is a pattern, list or file)
+    if not glob.has_magic(input_folder) and not Path(input_folder).is_file():
+        Path(input_folder).mkdir(exist_ok=True)
     
     print(f"\nPlease place your road images in the '{input_folder}' folder")
     print("Supported formats: JPG, JPEG, PNG, BMP, TIFF")
     print("\nStarting detection process...")
     
+    # Processes, OpenCV threads per process and UMat
+    threads = args.threads if args.threads is not None else (1 if args.workers > 1 else 0)
+    backend = ExecutionBackend(args.workers, threads, args.umat)
+    if args.auto_backend:
+        sample = encode_images(iter_image_files(input_folder, args.recursive, args.sniff))
+        if sample:
+            print(f"\nTiming execution backends on {len(sample)} image(s)...")
+            backend, timings = choose_backend(sample, detector.config, repeat=2)
+            for candidate, images_per_sec in timings:
+                print(f"  {str(candidate):<45} {images_per_sec:6.1f} images/sec")
+            print(f"Using {backend}")
+    backend.apply()
+    detector.use_umat = backend.umat
+    
+    # Result cache for images that were already processed with the same settings
+    cache = None
+    if args.cache_dir:
+        # Records that carry contours are cached separately from those that do not
+        fingerprint = detector.fingerprint() + ("-contours" if detector.keep_contours else "")
+        cache = DetectionCache(args.cache_dir, fingerprint,
+                               max_bytes=args.cache_size_mb * 1024 * 1024)
+    
+    # Columnar per-pothole store
+    store = None
+    if args.store:
+        store = DetectionStore(args.store, contours=args.store_contours)
+    
+    # Journal and running totals for resuming an interrupted batch
+    checkpoint = None
+    manifest = None
+    if args.checkpoint or args.resume:
+        checkpoint = BatchCheckpoint(output_folder, flush_every=args.checkpoint_every,
+                                     resume=args.resume, store=store)
+        if checkpoint.restored:
+            print(f"Restored {checkpoint.restored} journaled image(s) to the detection store")
+        manifest = BatchManifest(output_folder, args.max_attempts, resume=args.resume)
+    
+    # Ground-plane areas for the camera rig
+    if args.calibration:
+        detector.calibration = load_calibration(args.calibration)
+        print(f"Calibration: {detector.calibration.name}")
+    
+    # Locations and unique potholes across overlapping images
+    geo = None
+    if args.geo or args.gps_csv:
+        table = load_location_table(args.gps_csv) if args.gps_csv else None
+        geo = GeoIndex(args.merge_radius, GeoLocator(table))
+    
     # Process images
-    detector.process_images(input_folder, output_folder)
+    detector.process_images(input_folder, output_folder,
+                            workers=backend.workers, chunksize=args.chunksize,
+                            stream=args.stream, cache=cache, io_threads=args.io_threads,
+                            store=store, checkpoint=checkpoint, manifest=manifest,
+                            threads=backend.threads, geo=geo, recursive=args.recursive,
+                            sniff=args.sniff, sort=not args.unsorted)
+    
+    if checkpoint is not None:
+        checkpoint.close()
+        manifest.close()
+    
+    if detector.calibration is not None and detector.calibration.mismatched:
+        print(f"⚠️  {detector.calibration.mismatched} image(s) do not fit the calibration's "
+              f"image size; their areas stay in pixels")
+    
+    if store is not None:
+        store.close()
+        print(f"Detections stored: {args.store}")
+    
+    if cache is not None:
+        cache.close()
+        print(f"\nResult cache: {cache.hits} hit(s), {cache.misses} miss(es)")
     
-    if detector.results:
+    if detector.aggregates.images:
         print(f"\n✅ Processing complete!")
         print(f"Results saved in '{output_folder}' folder")
-        print(f"Total images processed: {len(detector.results)}")
-        print(f"Total potholes detected: {sum(r['pothole_count'] for r in detector.results)}")
+        print(f"Total images processed: {detector.aggregates.images}")
+        print(f"Total potholes detected: {detector.aggregates.potholes}")
     else:
         print(f"\n❌ No images found in '{input_folder}' folder")
         print("Please add some road images and run again.")
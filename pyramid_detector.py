@@ -0,0 +1,99 @@
+"""
+Two-pass pothole detection for high-resolution frames
+A cheap pass on a downscaled copy finds candidate regions with the usual
+contour filters scaled to match; the full-resolution pipeline then runs
+only on windows around those candidates, and frames without candidates
+stop after the cheap pass
+"""
+import cv2
+import numpy as np
+
+from detector_config import DetectorConfig
+from pothole_detector import PotholeDetector
+from tiled_detector import (WindowCLAHE, _group_boxes, _touches_inner_edge, clahe_tile_size,
+                            snap_window)
+
+class PyramidPotholeDetector:
+    """Coarse-to-fine detector with the same find_potholes/draw_potholes interface
+
+    The coarse pass is a PotholeDetector with scale=pyramid_scale whose size
+    thresholds are additionally loosened by relax, so borderline potholes
+    still become candidates. Each candidate gets a full-resolution window
+    (grown by margin pixels) snapped to the CLAHE tile grid of the whole
+    frame plus one tile of context, so the window's CLAHE tiles coincide with
+    the frame's and contours inside the window come out exactly as they would
+    on the whole frame. Potholes too small to survive the downscale can still
+    be missed. Like PotholeDetector, an instance is not thread-safe.
+    """
+
+    def __init__(self, config=None, pyramid_scale=0.25, margin=32, relax=0.5):
+        self.config = (config or DetectorConfig()).with_overrides(scale=1.0)
+        coarse_config = self.config.with_overrides(
+            scale=pyramid_scale,
+            min_area=self.config.min_area * relax,
+            min_size=int(self.config.min_size * relax))
+        self.coarse = PotholeDetector(coarse_config)
+        # Candidates are verified at full resolution, so the coarse level can
+        # be sampled instead of averaged (several times cheaper on 4K frames)
+        self.coarse.interpolation = cv2.INTER_LINEAR
+        self.fine = PotholeDetector(self.config)
+        self.margin = margin
+        # CLAHE objects by window grid size
+        self._clahe = {}
+        self.frames = 0
+        self.early_exits = 0
+
+    def find_potholes(self, image):
+        """Detect potholes in a BGR or grayscale image; coordinates are full resolution"""
+        self.frames += 1
+        candidates = self.coarse.find_potholes(image)
+        if not candidates:
+            self.early_exits += 1
+            return []
+
+        height, width = image.shape[:2]
+        windows = [self._window(candidate['bbox'], width, height) for candidate in candidates]
+
+        contours = []
+        for group in _group_boxes([(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in windows]):
+            window = (min(windows[i][0] for i in group), min(windows[i][1] for i in group),
+                      max(windows[i][2] for i in group), max(windows[i][3] for i in group))
+            contours.extend(self._window_contours(image, window))
+
+        # Size limits are relative to the whole frame, not the window
+        return self.fine.filter_contours(contours, width, height)
+
+    def draw_potholes(self, image, potholes, in_place=False):
+        """Return the image with the detected potholes marked"""
+        return self.fine.draw_potholes(image, potholes, in_place)
+
+    def _window(self, bbox, width, height):
+        """Window around a candidate box, snapped to CLAHE tiles plus one tile of context"""
+        x, y, w, h = bbox
+        rect = (x - self.margin, y - self.margin, x + w + self.margin, y + h + self.margin)
+        window, _ = snap_window(rect, width, height,
+                                clahe_tile_size(width, height, self.config.clahe_grid))
+        return window
+
+    def _window_contours(self, image, window):
+        """Contours of one window, in frame coordinates, that match whole-frame processing"""
+        height, width = image.shape[:2]
+        grid = self.config.clahe_grid
+        tile_w, tile_h = clahe_tile_size(width, height, grid)
+        x0, y0, x1, y1 = window
+        self.fine.clahe = WindowCLAHE(window, width, height, grid, self.config.clahe_clip_limit,
+                                      self._clahe)
+
+        # The context tile on each inner side only feeds the CLAHE interpolation
+        inner = (x0 + tile_w if x0 > 0 else 0, y0 + tile_h if y0 > 0 else 0,
+                 x1 - tile_w if x1 < width else width, y1 - tile_h if y1 < height else height)
+
+        contours = []
+        for contour in self.fine.find_contours(np.ascontiguousarray(image[y0:y1, x0:x1])):
+            contour = contour + np.array([x0, y0], dtype=contour.dtype)
+            x, y, w, h = cv2.boundingRect(contour)
+            if _touches_inner_edge((x, y, w, h), window, width, height):
+                continue
+            if inner[0] <= x and inner[1] <= y and x + w <= inner[2] and y + h <= inner[3]:
+                contours.append(contour)
+        return contours
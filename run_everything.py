@@ -4,11 +4,26 @@ One-click pothole detection runner
 This script does everything automatically - just run it!
 """
 
+import time
+
+# Measured from the first line so the report covers the whole cold start
+_START = time.perf_counter()
+
+import importlib.util
 import subprocess
 import sys
 import os
 from pathlib import Path
 
+# Standard library only, so it works before the requirements are installed
+from image_discovery import iter_image_files
+
+# Import names of requirements whose package name differs
+MODULE_NAMES = {
+    'opencv-python': 'cv2',
+    'opencv-python-headless': 'cv2',
+}
+
 def run_command(command, description):
     """Run a command and handle errors"""
     print(f"\n🚀 {description}...")
@@ -26,43 +41,77 @@ def run_command(command, description):
             print("STDERR:", e.stderr)
         return False
 
+def missing_requirements(requirements_file="requirements.txt"):
+    """Requirements that cannot be imported (only presence is checked, not versions)"""
+    missing = []
+    with open(requirements_file) as f:
+        for line in f:
+            name = line.split('#')[0].split('==')[0].split('>=')[0].strip()
+            if not name:
+                continue
+            module = MODULE_NAMES.get(name.lower(), name.replace('-', '_'))
+            if importlib.util.find_spec(module) is None:
+                missing.append(name)
+    return missing
+
+def run_step(function, description):
+    """Run a step in this process and handle errors"""
+    print(f"\n🚀 {description}...")
+    try:
+        function()
+        print(f"✅ {description} completed successfully!")
+        return True
+    except Exception as e:
+        print(f"❌ Error in {description}: {e}")
+        return False
+
 def check_images():
     """Check if there are images to process"""
-    input_folder = Path("input_images")
-    extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-    
-    image_files = []
-    for ext in extensions:
-        image_files.extend(input_folder.glob(f'*{ext}'))
-        image_files.extend(input_folder.glob(f'*{ext.upper()}'))
-    
-    return len(image_files) > 0, len(image_files)
+    count = sum(1 for _ in iter_image_files("input_images", sort=False))
+    return count > 0, count
 
 def main():
     print("🎯 ONE-CLICK POTHOLE DETECTION SYSTEM")
     print("=" * 50)
     
-    # Step 1: Install requirements
-    if not run_command(f"{sys.executable} -m pip install -r requirements.txt", "Installing required packages"):
-        return
+    # Step 1: Install requirements, unless they are already there
+    missing = missing_requirements()
+    if missing:
+        if not run_command(f"{sys.executable} -m pip install -r requirements.txt",
+                           f"Installing required packages ({', '.join(missing)})"):
+            return
+        importlib.invalidate_caches()
+    else:
+        print("\n✅ Required packages already installed")
+    checked = time.perf_counter()
+    
+    # Imported only now: they need the packages installed above
+    import create_sample_images
+    import pothole_detector
+    ready = time.perf_counter()
+    print(f"\n⏱️  Cold start: {ready - _START:.2f}s "
+          f"(dependency check {checked - _START:.2f}s, imports {ready - checked:.2f}s)")
     
     # Step 2: Check for images
     has_images, num_images = check_images()
     
     if not has_images:
-        print("\\n📷 No images found in 'input_images' folder.")
+        print("\n📷 No images found in 'input_images' folder.")
         print("Creating sample images for demonstration...")
         
-        if run_command(f"{sys.executable} create_sample_images.py", "Creating sample images"):
+        if run_step(create_sample_images.main, "Creating sample images"):
             has_images, num_images = check_images()
     
     if has_images:
-        print(f"\\n📸 Found {num_images} image(s) to process")
+        print(f"\n📸 Found {num_images} image(s) to process")
         
         # Step 3: Run detection
-        if run_command(f"{sys.executable} run_detection.py", "Running pothole detection"):
-            print("\\n🎉 DETECTION COMPLETE!")
-            print("\\n📁 Check these folders for results:")
+        started = time.perf_counter()
+        if run_step(lambda: pothole_detector.main([]), "Running pothole detection"):
+            print(f"\n⏱️  Detection: {time.perf_counter() - started:.2f}s, "
+                  f"total: {time.perf_counter() - _START:.2f}s")
+            print("\n🎉 DETECTION COMPLETE!")
+            print("\n📁 Check these folders for results:")
             print("   • output_results/ - Contains detected images and reports")
             print("   • input_images/ - Contains your input images")
             
@@ -70,13 +119,13 @@ def main():
             output_folder = Path("output_results")
             if output_folder.exists():
                 files = list(output_folder.glob("*"))
-                print(f"\\n📄 Generated {len(files)} output files:")
+                print(f"\n📄 Generated {len(files)} output files:")
                 for file in files:
                     print(f"   • {file.name}")
         else:
-            print("\\n❌ Detection failed. Check error messages above.")
+            print("\n❌ Detection failed. Check error messages above.")
     else:
-        print("\\n❌ No images found. Please add some road images to 'input_images' folder and run again.")
+        print("\n❌ No images found. Please add some road images to 'input_images' folder and run again.")
 
 if __name__ == "__main__":
     main()
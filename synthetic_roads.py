@@ -0,0 +1,63 @@
+"""
+Seeded synthetic road image generator
+One reproducible version of the asphalt-with-potholes images drawn by
+create_sample_images.py, create_real_images.py and save_uploaded_image.py,
+with resolution, pothole count and noise level as parameters
+"""
+import cv2
+import numpy as np
+
+def generate_road_image(width=800, height=600, potholes=4, noise=20, seed=0,
+                        water=True, markings=True):
+    """Draw a road surface with irregular potholes
+
+    Returns (image, boxes) where boxes are the (x, y, w, h) extents of the
+    drawn potholes. The same arguments always give the same image.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Asphalt base with per-pixel texture
+    base = int(rng.integers(85, 121))
+    texture = rng.integers(-noise, noise + 1, (height, width, 3)) if noise else 0
+    image = np.clip(base + texture, 0, 255).astype(np.uint8)
+
+    if markings:
+        cv2.line(image, (width // 2, 0), (width // 2, height), (0, 255, 255), max(2, width // 150))
+
+    # Pothole sizes scale with the image so counts stay comparable across resolutions
+    scale = min(width, height) / 600
+    boxes = []
+    for _ in range(potholes):
+        w = int(rng.integers(40, 120) * scale)
+        h = int(w * rng.uniform(0.6, 0.9))
+        x = int(rng.integers(w, max(w + 1, width - w)))
+        y = int(rng.integers(h, max(h + 1, height - h)))
+
+        # Irregular rim made of overlapping dark blobs
+        steps = 30
+        for i in range(steps):
+            angle = np.radians(i * 360 / steps)
+            rx = w // 2 + rng.integers(-w // 6, w // 6 + 1)
+            ry = h // 2 + rng.integers(-h // 6, h // 6 + 1)
+            px = int(x + rx * np.cos(angle))
+            py = int(y + ry * np.sin(angle))
+            cv2.circle(image, (px, py), int(rng.integers(8, 15) * scale) or 1, (25, 25, 25), -1)
+
+        # Dark interior
+        cv2.ellipse(image, (x, y), (w // 2, h // 2), 0, 0, 360, (15, 15, 15), -1)
+
+        if water:
+            # Grayish water surface with a reflection
+            cv2.ellipse(image, (x, y), (max(1, w // 2 - 5), max(1, h // 2 - 5)), 0, 0, 360,
+                        (95, 105, 115), -1)
+            cv2.ellipse(image, (x - w // 6, y - h // 6), (max(1, w // 4), max(1, h // 6)),
+                        0, 0, 120, (130, 140, 150), -1)
+
+        boxes.append((x - w // 2, y - h // 2, w, h))
+
+    return image, boxes
+
+def generate_dataset(count, width=800, height=600, potholes=4, noise=20, seed=0):
+    """Yield (image, boxes) for count images; image i uses seed + i"""
+    for i in range(count):
+        yield generate_road_image(width, height, potholes, noise, seed + i)
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Pothole detection on dashcam video and other frame streams
+Frames are decoded on a background thread, run through the same
+preprocessing -> Canny -> contour pipeline as still images, and linked
+across frames so each pothole is counted once
+"""
+import argparse
+import collections
+import functools
+import multiprocessing
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+
+from detector_config import add_config_arguments, config_from_args
+from frame_ring import FrameRing, prepare_workers
+from pothole_detector import PotholeDetector
+from pyramid_detector import PyramidPotholeDetector
+
+class FrameReader:
+    """Decode frames from a cv2.VideoCapture source on a background thread
+
+    Only every stride-th frame is decoded; the frames in between are skipped
+    with grab(), which demuxes without converting to BGR. Decoded frames wait
+    in a bounded queue, so the reader never runs more than queue_size frames
+    ahead of the detector.
+
+    With ring_slots > 0 frames are decoded straight into the slots of a
+    FrameRing (created from the first frame's size and kept in self.ring)
+    and the reader yields slot indices instead of arrays. The consumer
+    releases each slot when it is done with the frame, and the reader waits
+    for a free slot before decoding the next one.
+    """
+
+    def __init__(self, source, stride=1, queue_size=8, ring_slots=0):
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video source {source}")
+
+        self.stride = max(1, stride)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 0.0
+        self.frames_read = 0
+        self.ring_slots = ring_slots
+        self.ring = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __iter__(self):
+        """Yield (frame_index, frame) pairs, or (frame_index, slot) with a ring, until the source is exhausted"""
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop decoding and release the capture (the ring stays open for pending frames)"""
+        self._stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(timeout=0.1)
+        self.capture.release()
+
+    def _run(self):
+        """Reader thread: decode kept frames and skip the rest"""
+        index = 0
+        try:
+            while not self._stop.is_set():
+                if index % self.stride:
+                    if not self.capture.grab():
+                        break
+                elif self.ring_slots:
+                    slot = self._read_into_ring()
+                    if slot is None:
+                        break
+                    self._put((index, slot))
+                else:
+                    ok, frame = self.capture.read()
+                    if not ok:
+                        break
+                    self._put((index, frame))
+                index += 1
+        finally:
+            self.frames_read = index
+            self._put(None)
+
+    def _read_into_ring(self):
+        """Decode the next frame into a free ring slot and return the slot (None at the end)"""
+        if self.ring is None:
+            ok, frame = self.capture.read()
+            if not ok:
+                return None
+            self.ring = FrameRing(self.ring_slots, frame.shape)
+            slot = self.ring.acquire()
+            self.ring.view(slot)[:] = frame
+            return slot
+
+        if not self.capture.grab():
+            return None
+        slot = None
+        while slot is None:
+            if self._stop.is_set():
+                return None
+            slot = self.ring.acquire(timeout=0.1)
+
+        view = self.ring.view(slot)
+        ok, frame = self.capture.retrieve(view)
+        if ok and not np.shares_memory(frame, view):
+            # OpenCV decoded elsewhere because the frame did not fit the slot
+            if self.ring.fits(frame.shape):
+                view[:] = frame
+            else:
+                print(f"Error: Frame size changed to {frame.shape[1]}x{frame.shape[0]}, stopping")
+                ok = False
+        if not ok:
+            self.ring.release(slot)
+            return None
+        return slot
+
+    def _put(self, item):
+        """Queue an item, giving up if the reader is being stopped"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+# Per-process detector and attached rings of the frame worker pool
+_frame_detector = None
+_frame_rings = {}
+
+def _init_frame_worker(detector_factory):
+    """Build a detector once per worker process"""
+    global _frame_detector
+    # Each worker gets a single OpenCV thread so the pool does not oversubscribe cores
+    cv2.setNumThreads(1)
+    _frame_detector = detector_factory()
+
+def _detect_frame(ring_spec, slot):
+    """Worker task: detect potholes in a ring slot; only the detections travel back"""
+    name = ring_spec[2]
+    ring = _frame_rings.get(name)
+    if ring is None:
+        ring = _frame_rings[name] = FrameRing.attach(*ring_spec)
+    return _frame_detector.find_potholes(ring.view(slot))
+
+def _iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+class PotholeTracker:
+    """Link detections in consecutive processed frames into tracks
+
+    A detection continues a track when its bounding box overlaps the track's
+    last box by at least iou_threshold. Tracks that go unmatched for more than
+    max_missed processed frames are closed. Each track is one unique pothole.
+    """
+
+    def __init__(self, iou_threshold=0.2, max_missed=2):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.active = []
+        self.finished = []
+        self.next_id = 1
+
+    def update(self, frame_index, potholes):
+        """Match one frame's potholes to tracks and return their track ids"""
+        # Greedy matching, best overlaps first
+        pairs = []
+        for t, track in enumerate(self.active):
+            for p, pothole in enumerate(potholes):
+                overlap = _iou(track['bbox'], pothole['bbox'])
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, t, p))
+        pairs.sort(reverse=True)
+
+        track_ids = [None] * len(potholes)
+        matched_tracks = set()
+        for _, t, p in pairs:
+            if t in matched_tracks or track_ids[p] is not None:
+                continue
+            matched_tracks.add(t)
+            track = self.active[t]
+            self._extend(track, frame_index, potholes[p])
+            track_ids[p] = track['id']
+
+        for p, pothole in enumerate(potholes):
+            if track_ids[p] is None:
+                track = {
+                    'id': self.next_id,
+                    'first_frame': frame_index,
+                    'last_frame': frame_index,
+                    'hits': 0,
+                    'missed': 0,
+                    'bbox': pothole['bbox'],
+                    'max_area': 0,
+                }
+                self.next_id += 1
+                self._extend(track, frame_index, pothole)
+                self.active.append(track)
+                matched_tracks.add(len(self.active) - 1)
+                track_ids[p] = track['id']
+
+        still_active = []
+        for t, track in enumerate(self.active):
+            if t not in matched_tracks:
+                track['missed'] += 1
+            if track['missed'] > self.max_missed:
+                self.finished.append(track)
+            else:
+                still_active.append(track)
+        self.active = still_active
+
+        return track_ids
+
+    def close(self):
+        """Close all open tracks and return every track, ordered by id"""
+        self.finished.extend(self.active)
+        self.active = []
+        return sorted(self.finished, key=lambda track: track['id'])
+
+    def _extend(self, track, frame_index, pothole):
+        """Add a detection to a track"""
+        track['last_frame'] = frame_index
+        track['hits'] += 1
+        track['missed'] = 0
+        track['bbox'] = pothole['bbox']
+        track['max_area'] = max(track['max_area'], pothole['area'])
+
+def process_video(source, output_folder=None, detector=None, stride=1, queue_size=8,
+                  iou_threshold=0.2, max_missed=2, min_hits=1, write_video=False,
+                  workers=1, detector_factory=None):
+    """Detect potholes in a video file or stream and count each one once
+
+    With workers > 1, frames are decoded into a shared-memory FrameRing and
+    detected by a pool of processes, each with a detector from
+    detector_factory (default: a PotholeDetector with the detector's config).
+    Results are tracked in frame order either way.
+
+    Returns a summary dict with frame counts, throughput and the list of
+    tracks (unique potholes) seen in at least min_hits processed frames.
+    """
+    detector = detector or PotholeDetector()
+    ring_slots = queue_size + workers + 2 if workers > 1 else 0
+    reader = FrameReader(source, stride=stride, queue_size=queue_size, ring_slots=ring_slots)
+    tracker = PotholeTracker(iou_threshold=iou_threshold, max_missed=max_missed)
+
+    writer = None
+    if write_video and output_folder:
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+        video_path = Path(output_folder) / f"detected_{Path(str(source)).stem}.mp4"
+
+    frames_processed = 0
+    detections = 0
+    start = time.perf_counter()
+
+    def add_frame(frame_index, frame, potholes):
+        nonlocal writer, frames_processed, detections
+        track_ids = tracker.update(frame_index, potholes)
+        frames_processed += 1
+        detections += len(potholes)
+
+        if write_video and output_folder:
+            annotated = detector.draw_potholes(frame, potholes)
+            for pothole, track_id in zip(potholes, track_ids):
+                x, y, w, h = pothole['bbox']
+                cv2.putText(annotated, f"#{track_id}", (x, y + h + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+            if writer is None:
+                height, width = annotated.shape[:2]
+                fps = reader.fps / reader.stride if reader.fps else 30.0 / reader.stride
+                writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*"mp4v"),
+                                         fps, (width, height))
+            writer.write(annotated)
+
+    if workers > 1:
+        factory = detector_factory or functools.partial(PotholeDetector, detector.config)
+        prepare_workers()
+        pool = multiprocessing.Pool(workers, initializer=_init_frame_worker, initargs=(factory,))
+        # (frame_index, slot, result) in frame order; a slot is released once its frame is tracked
+        pending = collections.deque()
+
+        def finish_oldest():
+            frame_index, slot, result = pending.popleft()
+            potholes = result.get()
+            add_frame(frame_index, reader.ring.view(slot), potholes)
+            reader.ring.release(slot)
+
+        try:
+            for frame_index, slot in reader:
+                pending.append((frame_index, slot,
+                                pool.apply_async(_detect_frame, (reader.ring.spec, slot))))
+                if len(pending) > workers:
+                    finish_oldest()
+            while pending:
+                finish_oldest()
+        finally:
+            pool.terminate()
+            pool.join()
+            if reader.ring is not None:
+                reader.ring.close()
+    else:
+        for frame_index, frame in reader:
+            add_frame(frame_index, frame, detector.find_potholes(frame))
+
+    elapsed = time.perf_counter() - start
+    if writer is not None:
+        writer.release()
+
+    tracks = [track for track in tracker.close() if track['hits'] >= min_hits]
+
+    return {
+        'source': str(source),
+        'frames_read': reader.frames_read,
+        'frames_processed': frames_processed,
+        'detections': detections,
+        'unique_potholes': len(tracks),
+        'tracks': tracks,
+        'elapsed': elapsed,
+        'fps': reader.frames_read / elapsed if elapsed > 0 else 0.0,
+    }
+
+def write_video_report(summary, output_folder):
+    """Write a text report of the unique potholes found in a video"""
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    report_path = Path(output_folder) / f"{Path(summary['source']).stem}_video_report.txt"
+
+    with open(report_path, 'w') as f:
+        f.write("POTHOLE VIDEO DETECTION REPORT\n")
+        f.write("=" * 50 + "\n\n")
+        f.write(f"Source: {summary['source']}\n")
+        f.write(f"Frames read: {summary['frames_read']}\n")
+        f.write(f"Frames processed: {summary['frames_processed']}\n")
+        f.write(f"Throughput: {summary['fps']:.1f} frames/sec\n")
+        f.write(f"Per-frame detections: {summary['detections']}\n")
+        f.write(f"Unique potholes: {summary['unique_potholes']}\n\n")
+
+        f.write("TRACKS:\n")
+        f.write("-" * 30 + "\n")
+        for track in summary['tracks']:
+            f.write(f"  Pothole {track['id']}: frames {track['first_frame']}-{track['last_frame']}"
+                    f" ({track['hits']} detections), max area = {track['max_area']:.0f} pixels\n")
+
+    return report_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect potholes in a video or camera stream")
+    parser.add_argument("source", help="video file, stream URL or camera index")
+    parser.add_argument("--output", default="output_results", help="folder for results")
+    parser.add_argument("--stride", type=int, default=1, help="process every N-th frame")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="maximum number of decoded frames waiting for the detector")
+    parser.add_argument("--iou", type=float, default=0.2,
+                        help="box overlap needed to link detections across frames")
+    parser.add_argument("--max-missed", type=int, default=2,
+                        help="processed frames a pothole may go undetected before its track ends")
+    parser.add_argument("--min-hits", type=int, default=1,
+                        help="detections needed before a track counts as a pothole")
+    parser.add_argument("--write-video", action="store_true", help="save an annotated video")
+    parser.add_argument("--pyramid-scale", type=float, default=None,
+                        help="find candidates on a copy downscaled by this factor (e.g. 0.25 "
+                             "for 4K) and run full resolution only around them")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="detector processes; frames reach them through shared memory")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    source = int(args.source) if args.source.isdigit() else args.source
+
+    print("POTHOLE VIDEO DETECTION")
+    print("=" * 40)
+
+    if args.pyramid_scale:
+        detector_factory = functools.partial(PyramidPotholeDetector, config_from_args(args),
+                                             pyramid_scale=args.pyramid_scale)
+    else:
+        detector_factory = functools.partial(PotholeDetector, config_from_args(args))
+    detector = detector_factory()
+    summary = process_video(source, args.output, detector=detector, stride=args.stride,
+                            queue_size=args.queue_size, iou_threshold=args.iou,
+                            max_missed=args.max_missed, min_hits=args.min_hits,
+                            write_video=args.write_video, workers=args.workers,
+                            detector_factory=detector_factory)
+    report_path = write_video_report(summary, args.output)
+
+    print(f"Frames read: {summary['frames_read']} ({summary['frames_processed']} processed)")
+    print(f"Throughput: {summary['fps']:.1f} frames/sec")
+    print(f"Unique potholes: {summary['unique_potholes']}")
+    if args.pyramid_scale and args.workers <= 1:
+        print(f"Frames without candidates: {detector.early_exits} of {detector.frames}")
+    print(f"Report saved: {report_path}")
+
+if __name__ == "__main__":
+    main()